@@ -0,0 +1,83 @@
+"""
+Cost of an environment step against the number of obstacles,
+with and without the broad-phase in ModelWrapper.
+Obstacles are small random boxes in a planar unit square, the robot is a 2D sphere.
+"""
+
+import argparse
+import time
+
+import hppfcl
+import numpy as np
+import pinocchio as pin
+
+from mpenv.core.mesh import Mesh
+from mpenv.core.model import ModelWrapper
+from mpenv.envs.base import Base
+
+
+class BoxesWorld(Base):
+    def __init__(self, broadphase):
+        super().__init__(robot_name="sphere2d")
+        self.broadphase = broadphase
+        self.freeflyer_bounds = np.array(
+            [[0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 1.0], [1.0, 1.0, 0.0, 0.0, 0.0, 0.0, 1.0]]
+        )
+
+    def build(self, n_obstacles, seed):
+        np_random = np.random.RandomState(seed)
+        geom_objs = []
+        for i in range(n_obstacles):
+            size = np_random.uniform(0.005, 0.03, 3)
+            size[2] = 0.02
+            placement = pin.SE3.Identity()
+            placement.translation = np.append(np_random.uniform(0, 1, 2), 0)
+            mesh = Mesh(
+                name=f"box{i}", geometry=hppfcl.Box(*size), placement=placement
+            )
+            geom_objs.append(mesh.geom_obj())
+        self.model_wrapper = ModelWrapper()
+        self.build_world("sphere2d", self.freeflyer_bounds, geom_objs)
+
+
+def run(n_obstacles, broadphase, n_steps, seed):
+    env = BoxesWorld(broadphase)
+    env.build(n_obstacles, seed)
+    model_wrapper = env.model_wrapper
+    pin.seed(seed)
+    np_random = np.random.RandomState(seed)
+    state = env.random_configuration()
+    velocities = np.zeros((n_steps, 6))
+    velocities[:, :2] = np_random.uniform(-0.05, 0.05, (n_steps, 2))
+    labels = []
+    start = time.perf_counter()
+    for velocity in velocities:
+        next_state, collision_labels = env.move(state, velocity)
+        labels.append(collision_labels.copy())
+        state = model_wrapper.clip(
+            next_state, env.robot.bounds[0], env.robot.bounds[1]
+        )[1]
+    duration = time.perf_counter() - start
+    return duration / n_steps, np.array(labels)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n-steps", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{'obstacles':>10} {'narrow-phase':>14} {'broad-phase':>14} {'speedup':>8}")
+    for n_obstacles in [5, 10, 50, 100, 500, 1000]:
+        t_narrow, labels_narrow = run(n_obstacles, False, args.n_steps, args.seed)
+        t_broad, labels_broad = run(n_obstacles, True, args.n_steps, args.seed)
+        if not np.array_equal(labels_narrow, labels_broad):
+            raise RuntimeError("broad-phase changed the collision labels")
+        print(
+            f"{n_obstacles:>10} {1e3 * t_narrow:>11.3f} ms {1e3 * t_broad:>11.3f} ms"
+            f" {t_narrow / t_broad:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
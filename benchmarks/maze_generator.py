@@ -0,0 +1,115 @@
+"""
+Depth-first maze carving, the previous Cell objects generator drawing from the random
+module against the wall arrays of mpenv.envs.maze_generator, one maze at a time with
+Maze.make_maze and batches of mazes carved in lockstep with carve_mazes. Lockstep
+carving only pays off from batches of a few hundred mazes, make_mazes switches to
+it from BATCH_CARVE_MIN mazes
+"""
+
+import argparse
+import random
+import timeit
+
+import numpy as np
+
+from mpenv.envs.maze_generator import Maze, carve_mazes
+
+
+class Cell:
+    wall_pairs = {"N": "S", "S": "N", "E": "W", "W": "E"}
+
+    def __init__(self, x, y):
+        self.x, self.y = x, y
+        self.walls = {"N": True, "S": True, "E": True, "W": True}
+
+    def has_all_walls(self):
+        return all(self.walls.values())
+
+    def knock_down_wall(self, other, wall):
+        self.walls[wall] = False
+        other.walls[Cell.wall_pairs[wall]] = False
+
+
+class CellMaze:
+    def __init__(self, nx, ny, ix=0, iy=0):
+        self.nx, self.ny = nx, ny
+        self.ix, self.iy = ix, iy
+        self.maze_map = [[Cell(x, y) for y in range(ny)] for x in range(nx)]
+
+    def cell_at(self, x, y):
+        return self.maze_map[x][y]
+
+    def find_valid_neighbours(self, cell):
+        delta = [("W", (-1, 0)), ("E", (1, 0)), ("S", (0, 1)), ("N", (0, -1))]
+        neighbours = []
+        for direction, (dx, dy) in delta:
+            x2, y2 = cell.x + dx, cell.y + dy
+            if (0 <= x2 < self.nx) and (0 <= y2 < self.ny):
+                neighbour = self.cell_at(x2, y2)
+                if neighbour.has_all_walls():
+                    neighbours.append((direction, neighbour))
+        return neighbours
+
+    def make_maze(self):
+        n = self.nx * self.ny
+        cell_stack = []
+        current_cell = self.cell_at(self.ix, self.iy)
+        nv = 1
+        while nv < n:
+            neighbours = self.find_valid_neighbours(current_cell)
+            if not neighbours:
+                current_cell = cell_stack.pop()
+                continue
+            direction, next_cell = random.choice(neighbours)
+            current_cell.knock_down_wall(next_cell, direction)
+            cell_stack.append(current_cell)
+            current_cell = next_cell
+            nv += 1
+
+
+def make_cell_maze(grid_size):
+    maze = CellMaze(grid_size, grid_size)
+    maze.make_maze()
+
+
+def make_array_maze(grid_size, np_random):
+    maze = Maze(grid_size, grid_size, np_random=np_random)
+    maze.make_maze()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--grid-sizes", type=int, nargs="+", default=[3, 8, 16, 32, 64])
+    parser.add_argument("--batch-size", type=int, default=1024)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    np_random = np.random.RandomState(args.seed)
+    print(f"times per maze, batches of {args.batch_size} mazes")
+    print(f"{'grid':>5} {'cells':>12} {'arrays':>12} {'lockstep':>12} {'speedup':>8}")
+    for grid_size in args.grid_sizes:
+        number = args.repeat * args.batch_size
+        draws = np_random.random_sample((args.batch_size, grid_size ** 2 - 1))
+        t_cells = timeit.timeit(lambda: make_cell_maze(grid_size), number=number)
+        t_arrays = timeit.timeit(
+            lambda: make_array_maze(grid_size, np_random), number=number
+        )
+        t_batch = timeit.timeit(
+            lambda: carve_mazes(grid_size, grid_size, draws), number=args.repeat
+        )
+        t_cells, t_arrays, t_batch = (
+            t_cells / number,
+            t_arrays / number,
+            t_batch / number,
+        )
+        print(
+            f"{grid_size:>5} {1e3 * t_cells:>9.3f} ms {1e3 * t_arrays:>9.3f} ms"
+            f" {1e3 * t_batch:>9.3f} ms"
+            f" {t_cells / min(t_arrays, t_batch):>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
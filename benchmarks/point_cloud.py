@@ -0,0 +1,70 @@
+"""
+Local representation of a point cloud with normals as computed each step by
+PointCloudObserver.represent_obstacles, transform, normalization and flattening
+with intermediate arrays against the fused affine map written into a buffer
+"""
+
+import argparse
+import timeit
+
+import numpy as np
+import pinocchio as pin
+
+from mpenv.core import se3
+from mpenv.core import utils
+
+NORMALIZER = {"mean": 0, "std": 0.4}
+
+
+def represent_unfused(ref, obstacles_pcd):
+    obstacles_repr = obstacles_pcd.copy()
+    ref_inv = se3.inverse(ref)
+    points, normals = obstacles_repr[:, :3], obstacles_repr[:, 3:]
+    points_ref = utils.apply_transformation(ref_inv, points)
+    normals_ref = normals.dot(ref_inv[:3, :3].T)
+    obstacles_repr = np.hstack((points_ref, normals_ref))
+    obstacles_repr[:, :3] -= NORMALIZER["mean"]
+    obstacles_repr[:, :3] /= NORMALIZER["std"]
+    obstacles_flat = obstacles_repr.flatten()
+    return np.hstack((obstacles_flat, obstacles_repr.shape[0]))
+
+
+def represent_fused(ref, obstacles_pcd, out):
+    n_points = obstacles_pcd.shape[0]
+    obstacles_repr = out[:-1].reshape(n_points, 6)
+    ref_inv = se3.inverse(ref)
+    rotation, translation = ref_inv[:3, :3], ref_inv[:3, 3]
+    scale = 1 / NORMALIZER["std"]
+    np.matmul(obstacles_pcd[:, :3], scale * rotation.T, out=obstacles_repr[:, :3])
+    obstacles_repr[:, :3] += scale * (translation - NORMALIZER["mean"])
+    np.matmul(obstacles_pcd[:, 3:], rotation.T, out=obstacles_repr[:, 3:])
+    out[-1] = n_points
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n-points", type=int, default=1024)
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+
+    obstacles_pcd = np.random.uniform(-0.6, 0.6, (args.n_points, 6))
+    ref = pin.SE3.Random().homogeneous
+    out = np.empty(6 * args.n_points + 1)
+    unfused = represent_unfused(ref, obstacles_pcd)
+    error = np.abs(unfused - represent_fused(ref, obstacles_pcd, out)).max()
+
+    t_unfused = timeit.timeit(
+        lambda: represent_unfused(ref, obstacles_pcd), number=args.repeat
+    )
+    t_fused = timeit.timeit(
+        lambda: represent_fused(ref, obstacles_pcd, out), number=args.repeat
+    )
+    t_unfused, t_fused = t_unfused / args.repeat, t_fused / args.repeat
+    print(f"{args.n_points} points, max error {error:.1e}")
+    print(f"unfused {1e6 * t_unfused:8.1f} us")
+    print(f"fused   {1e6 * t_fused:8.1f} us ({t_unfused / t_fused:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
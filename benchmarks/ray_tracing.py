@@ -0,0 +1,69 @@
+"""
+Rays cast by RayTracingObserver from a point of a maze, embree intersector of
+the obstacles mesh against the slab method of mpenv.core.boxes2d.
+The embree column is skipped when pyembree is not installed.
+"""
+
+import argparse
+import timeit
+
+import numpy as np
+
+from mpenv.core import boxes2d
+from mpenv.envs.maze import MazeGoal
+
+
+def planar_rays(n_rays):
+    theta = np.linspace(0, 2 * np.pi, n_rays)
+    return np.stack((np.cos(theta), np.sin(theta), np.zeros_like(theta)), 1)
+
+
+def embree_intersector(geoms):
+    try:
+        return geoms.ray_intersector()
+    except ImportError:
+        return None, None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--grid-size", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    env = MazeGoal(args.grid_size)
+    env.seed(args.seed)
+    env.reset()
+    geoms, boxes = env.geoms, env.boxes2d
+    intersector, scene = embree_intersector(geoms)
+    origin = env.state.q[None, :3].copy()
+    origin[:, 2] = 0
+
+    print(f"{boxes.shape[0]} boxes")
+    print(f"{'rays':>5} {'embree':>12} {'slab':>12} {'speedup':>8} {'hits':>5}")
+    for n_rays in [256, 512, 1024, 2048]:
+        origins, rays = geoms.compute_origins_rays(origin, planar_rays(n_rays))
+        points, normals, ray_indices = boxes2d.ray_intersections(origins, rays, boxes)
+        t_slab = timeit.timeit(
+            lambda: boxes2d.ray_intersections(origins, rays, boxes), number=args.repeat
+        )
+        t_slab /= args.repeat
+        if intersector is None:
+            embree, speedup = f"{'-':>12}", f"{'-':>8}"
+        else:
+            t_embree = timeit.timeit(
+                lambda: geoms.ray_intersections(intersector, scene, origins, rays),
+                number=args.repeat,
+            )
+            t_embree /= args.repeat
+            embree = f"{1e3 * t_embree:>9.3f} ms"
+            speedup = f"{t_embree / t_slab:>7.1f}x"
+        print(
+            f"{n_rays:>5} {embree} {1e3 * t_slab:>9.3f} ms {speedup}"
+            f" {ray_indices.shape[0]:>5}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""
+Relative motions between stacks of transforms as computed by Base.compute_rewards
+and RobotLinksObserver.represent_goal, per transform pin.log6 loop against mpenv.core.se3
+"""
+
+import argparse
+import timeit
+
+import numpy as np
+import pinocchio as pin
+
+from mpenv.core import se3
+
+
+def random_transforms(n):
+    return np.array([pin.SE3.Random().homogeneous for _ in range(n)])
+
+
+def log6_loop(T0, T1):
+    diff = np.linalg.inv(T0) @ T1
+    motions = np.zeros((diff.shape[0], 6))
+    for i, d in enumerate(diff):
+        m = pin.log6(d)
+        motions[i, :3] = m.linear
+        motions[i, 3:] = m.angular
+    return motions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'batch':>6} {'pin.log6 loop':>14} {'se3':>12} {'speedup':>8} {'max error':>10}")
+    for n in [1, 256, 4096]:
+        T0, T1 = random_transforms(n), random_transforms(n)
+        error = np.abs(log6_loop(T0, T1) - se3.difference(T0, T1)).max()
+        t_loop = timeit.timeit(lambda: log6_loop(T0, T1), number=args.repeat)
+        t_se3 = timeit.timeit(lambda: se3.difference(T0, T1), number=args.repeat)
+        t_loop, t_se3 = t_loop / args.repeat, t_se3 / args.repeat
+        print(
+            f"{n:>6} {1e3 * t_loop:>11.3f} ms {1e3 * t_se3:>9.3f} ms"
+            f" {t_loop / t_se3:>7.1f}x {error:>10.1e}"
+        )
+
+
+if __name__ == "__main__":
+    main()
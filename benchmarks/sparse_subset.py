@@ -0,0 +1,70 @@
+"""
+Greedy thinning of point clouds as done by RayTracingObserver.represent_obstacles
+(6D points and normals) and the Narrow 2D point cloud builders,
+accepted points loop against the grid hashed mpenv.core.utils.sparse_subset
+"""
+
+import argparse
+import timeit
+
+import numpy as np
+
+from mpenv.core import utils
+
+
+def sparse_subset_loop(points, r):
+    result = np.array([points[0]])
+    indices = np.array([0])
+    for i, p in enumerate(points):
+        if np.min(np.linalg.norm(result - p, axis=1)) >= r:
+            result = np.vstack((result, p))
+            indices = np.hstack((indices, i))
+    return result, indices
+
+
+def random_points(n, dim, seed=0):
+    np_random = np.random.RandomState(seed)
+    points = np_random.uniform(-0.7, 0.7, (n, dim))
+    if dim == 6:
+        normals = points[:, 3:]
+        points[:, 3:] = normals / np.linalg.norm(normals, axis=1, keepdims=True)
+    return points
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--r", type=float, default=0.06)
+    parser.add_argument(
+        "--loop-max", type=int, default=10000, help="largest size timed for the loop"
+    )
+    args = parser.parse_args()
+
+    print(f"{'dim':>3} {'points':>7} {'kept':>6} {'loop':>12} {'grid':>12} {'speedup':>8}")
+    for dim in [3, 6]:
+        for n in [1000, 10000, 100000]:
+            points = random_points(n, dim)
+            subset, indices = utils.sparse_subset(points, args.r)
+            t_grid = timeit.timeit(
+                lambda: utils.sparse_subset(points, args.r), number=args.repeat
+            )
+            t_grid /= args.repeat
+            if n <= args.loop_max:
+                subset_loop, indices_loop = sparse_subset_loop(points, args.r)
+                if not np.array_equal(indices, indices_loop):
+                    raise ValueError(f"Subsets differ for {n} points in {dim}D.")
+                t_loop = timeit.timeit(
+                    lambda: sparse_subset_loop(points, args.r), number=args.repeat
+                )
+                t_loop /= args.repeat
+                loop, speedup = f"{1e3 * t_loop:>9.1f} ms", f"{t_loop / t_grid:>7.1f}x"
+            else:
+                loop, speedup = f"{'-':>12}", f"{'-':>8}"
+            print(
+                f"{dim:>3} {n:>7} {indices.shape[0]:>6} {loop}"
+                f" {1e3 * t_grid:>9.1f} ms {speedup}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+"""
+Helper functions for planar worlds made of axis aligned boxes,
+boxes are stored in an array of shape (n, 4) as [x_min, y_min, x_max, y_max]
+"""
+
+import numpy as np
+import hppfcl
+
+
+def from_geom_objs(geom_objs):
+    boxes = np.zeros((len(geom_objs), 4))
+    for i, geom_obj in enumerate(geom_objs):
+        if not isinstance(geom_obj.geometry, hppfcl.Box):
+            raise ValueError(f"{geom_obj.name} is not a box.")
+        center = geom_obj.placement.translation[:2]
+        half_side = geom_obj.geometry.halfSide[:2]
+        boxes[i, :2] = center - half_side
+        boxes[i, 2:] = center + half_side
+    return boxes
+
+
+def points_distance(points, boxes):
+    """
+    distance from points of shape (m, 2) to boxes, 0 inside the boxes
+    returns an array of shape (m, n)
+    """
+    x, y = points[:, 0, None], points[:, 1, None]
+    dx = np.maximum(np.maximum(boxes[:, 0] - x, x - boxes[:, 2]), 0)
+    dy = np.maximum(np.maximum(boxes[:, 1] - y, y - boxes[:, 3]), 0)
+    return np.hypot(dx, dy)
+
+
+def points_signed_distance(points, boxes):
+    """
+    signed distance from points of shape (m, 2) to the union of boxes,
+    negative inside the boxes, np.inf without boxes
+    returns an array of shape (m,)
+    """
+    sdf = np.full(points.shape[0], np.inf)
+    x, y = points[:, 0], points[:, 1]
+    # a running minimum over the boxes keeps memory linear in the number of points
+    for x_min, y_min, x_max, y_max in boxes:
+        dx = np.maximum(x_min - x, x - x_max)
+        dy = np.maximum(y_min - y, y - y_max)
+        outside = np.hypot(np.maximum(dx, 0), np.maximum(dy, 0))
+        inside = np.minimum(np.maximum(dx, dy), 0)
+        np.minimum(sdf, outside + inside, out=sdf)
+    return sdf
+
+
+def slab_entry(px, py, dx, dy, x_min, y_min, x_max, y_max):
+    """
+    time in [0, 1] at which the segment p + t d enters the rectangle,
+    np.inf if the segment misses it
+    """
+    t_in, t_out = 0.0, 1.0
+    for p, d, lo, hi in ((px, dx, x_min, x_max), (py, dy, y_min, y_max)):
+        if d == 0:
+            if p < lo or p > hi:
+                return np.inf
+            continue
+        t0, t1 = (lo - p) / d, (hi - p) / d
+        if t0 > t1:
+            t0, t1 = t1, t0
+        t_in, t_out = max(t_in, t0), min(t_out, t1)
+        if t_in > t_out:
+            return np.inf
+    return t_in
+
+
+def circle_entry(px, py, dx, dy, cx, cy, radius):
+    """
+    time in [0, 1] at which the segment p + t d enters the circle,
+    np.inf if the segment misses it
+    """
+    a = dx * dx + dy * dy
+    ex, ey = px - cx, py - cy
+    b = ex * dx + ey * dy
+    c = ex * ex + ey * ey - radius * radius
+    disc = b * b - a * c
+    if disc < 0:
+        return np.inf
+    sqrt_disc = disc ** 0.5
+    t_in, t_out = (-b - sqrt_disc) / a, (-b + sqrt_disc) / a
+    if t_out < 0 or t_in > 1:
+        return np.inf
+    return max(t_in, 0.0)
+
+
+def segment_entry(p0, p1, boxes, radius):
+    """
+    time in [0, 1] at which a disk of given radius moving from p0 to p1 enters
+    each box, boxes inflated by the radius are rounded boxes made of two rectangles
+    and four circles. Assumes p0 is outside of the inflated boxes
+    returns an array of shape (n,), np.inf for the boxes which are not hit
+    """
+    n = boxes.shape[0]
+    t_entry = np.full(n, np.inf)
+    px, py = p0.tolist()
+    dx, dy = (p1 - p0).tolist()
+    if dx == 0 and dy == 0:
+        return t_entry
+    radius = np.broadcast_to(radius, (n,))
+    # few boxes are within reach of a motion, scalar tests are cheaper here
+    for i, (box, r) in enumerate(zip(boxes.tolist(), radius.tolist())):
+        x0, y0, x1, y1 = box
+        t_entry[i] = min(
+            slab_entry(px, py, dx, dy, x0 - r, y0, x1 + r, y1),
+            slab_entry(px, py, dx, dy, x0, y0 - r, x1, y1 + r),
+            circle_entry(px, py, dx, dy, x0, y0, r),
+            circle_entry(px, py, dx, dy, x1, y0, r),
+            circle_entry(px, py, dx, dy, x0, y1, r),
+            circle_entry(px, py, dx, dy, x1, y1, r),
+        )
+    return t_entry
+
+
+def first_contact(p0, p1, boxes, radius, tolerance=1e-4):
+    """
+    Continuous collision of a disk of given radius moving from p0 to p1
+    returns the time of first contact t in [0, 1], None if the motion is
+    collision free, and the boolean labels of the boxes with only the first box
+    in contact set, as ModelWrapper.collision_labels labels the first pair.
+    Follows ModelWrapper.continuous_collision conventions: the disk stops at most
+    at distance tolerance from the boxes, or at half its initial distance when
+    it starts closer than tolerance.
+    """
+    labels = np.zeros(boxes.shape[0], dtype=bool)
+    if boxes.shape[0] == 0:
+        return None, labels
+    clearance = points_distance(p0[None], boxes)[0] - radius
+    if (clearance <= 0).any():
+        labels[np.argmax(clearance <= 0)] = True
+        return 0.0, labels
+    # one threshold for the whole query, from the clearance to the closest box,
+    # so that sliding along a box does not enter the next collinear one
+    threshold = min(tolerance, clearance.min() / 2)
+    # only the boxes within reach of the motion can be hit
+    reachable = np.flatnonzero(clearance <= np.linalg.norm(p1 - p0) + threshold)
+    if reachable.shape[0] == 0:
+        return None, labels
+    t_entry = segment_entry(p0, p1, boxes[reachable], radius + threshold)
+    t = t_entry.min()
+    if t > 1:
+        return None, labels
+    # boxes are in the collision pairs order, the first one entered at t is labelled
+    labels[reachable[np.argmin(t_entry)]] = True
+    return t, labels
+
+
+def ray_intersections(origins, rays, boxes):
+    """
+    First hit of rays with the boxes by the slab method, rays of shape (m, 3) start
+    from origins of shape (m, 3) and are cast in the plane, their z component is
+    ignored. Follows Geometries.ray_intersections conventions: returns the hit points,
+    the normals of the faces hit and the indices of the rays which hit a box
+    """
+    ox, oy = origins[:, 0, None], origins[:, 1, None]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        inv_dx, inv_dy = 1 / rays[:, 0, None], 1 / rays[:, 1, None]
+        tx0, tx1 = (boxes[:, 0] - ox) * inv_dx, (boxes[:, 2] - ox) * inv_dx
+        ty0, ty1 = (boxes[:, 1] - oy) * inv_dy, (boxes[:, 3] - oy) * inv_dy
+    # nan comes from rays parallel to a face through its supporting line, ignore it
+    tx_near, tx_far = np.fmin(tx0, tx1), np.fmax(tx0, tx1)
+    ty_near, ty_far = np.fmin(ty0, ty1), np.fmax(ty0, ty1)
+    t_near, t_far = np.fmax(tx_near, ty_near), np.fmin(tx_far, ty_far)
+    # rays starting inside a box hit it on the way out
+    t_hit = np.where(t_near >= 0, t_near, t_far)
+    t_hit[(t_near > t_far) | (t_far < 0) | np.isnan(t_hit)] = np.inf
+
+    box_indices = t_hit.argmin(axis=1)
+    ray_indices = np.flatnonzero(np.isfinite(t_hit.min(axis=1)))
+    box_indices = box_indices[ray_indices]
+    t = t_hit[ray_indices, box_indices]
+    points = origins[ray_indices] + t[:, None] * rays[ray_indices]
+
+    # the face hit is the one of the slab giving t
+    entering = t_near[ray_indices, box_indices] >= 0
+    t_x = np.where(
+        entering,
+        tx_near[ray_indices, box_indices],
+        tx_far[ray_indices, box_indices],
+    )
+    axis = np.where(t_x == t, 0, 1)
+    rows = np.arange(t.shape[0])
+    normals = np.zeros((t.shape[0], 3))
+    normals[rows, axis] = np.where(entering, -1, 1) * np.sign(rays[ray_indices, axis])
+    return points, normals, ray_indices
+
+
+def occupancy_grid(boxes, grid_size, radius, supersampling=1):
+    """
+    Occupancy of a disk of given radius centered on the cells of a grid covering
+    the unit square, 1 when the disk intersects a box. Cells are ordered row by row
+    from the bottom left, as their centers returned with shape (grid_size ** 2, 2).
+    With supersampling s, the occupancy of a cell is the fraction of its s x s
+    subcells which are occupied.
+    Returns arrays of shape (grid_size ** 2,) and (grid_size ** 2, 2)
+    """
+    if supersampling < 1:
+        raise ValueError("supersampling should be at least 1.")
+    centers = np.linspace(0, 1, num=grid_size + 1)[:-1] + 1 / (2 * grid_size)
+    n = grid_size * supersampling
+    if supersampling == 1:
+        samples = centers
+    else:
+        samples = np.linspace(0, 1, num=n + 1)[:-1] + 1 / (2 * n)
+    occupied = np.zeros((n, n), dtype=bool)
+    # distances to a box are separable along x and y
+    for x_min, y_min, x_max, y_max in boxes:
+        dx = np.maximum(np.maximum(x_min - samples, samples - x_max), 0)
+        dy = np.maximum(np.maximum(y_min - samples, samples - y_max), 0)
+        occupied |= np.hypot(dx[None, :], dy[:, None]) < radius
+    occ_grid = occupied.reshape(
+        grid_size, supersampling, grid_size, supersampling
+    ).mean(axis=(1, 3))
+
+    x, y = np.meshgrid(centers, centers)
+    grid_samples = np.stack((x.flatten(), y.flatten()), axis=1)
+    return occ_grid.flatten(), grid_samples
@@ -0,0 +1,175 @@
+"""
+Columnar datasets of worlds made of primitive obstacles, stored in a directory of
+.npy files memory-mapped at opening. Geometries of all worlds are concatenated
+in flat arrays and world i owns the rows offsets[i]:offsets[i + 1].
+Worlds can also store a point cloud and its normals, with their own offsets.
+"""
+
+import os
+import numpy as np
+
+from mpenv.core import utils
+from mpenv.core.geometry import Geometries, UNION_CACHE_DIR
+
+GEOM_NAMES = ["box", "sphere", "cylinder", "capsule", "cone"]
+GEOM_TYPES = {name: i for i, name in enumerate(GEOM_NAMES)}
+# length of the geometry names
+NAME_LENGTH = 64
+
+
+def geom_size(props):
+    """
+    box half sides, sphere radius or radius and half length of the other primitives
+    """
+    size = np.zeros(3)
+    if props["name"] == "box":
+        size[:] = props["halfSide"]
+    elif props["name"] == "sphere":
+        size[0] = props["radius"]
+    else:
+        size[:2] = props["radius"], props["halfLength"]
+    return size
+
+
+def size_to_props(name, size):
+    if name == "box":
+        return {"name": name, "halfSide": np.array(size)}
+    elif name == "sphere":
+        return {"name": name, "radius": size[0]}
+    return {"name": name, "radius": size[0], "halfLength": size[1]}
+
+
+def save_dataset(
+    dirname, dataset_geoms, points=None, normals=None, union_cache_dir=UNION_CACHE_DIR
+):
+    """
+    Write a list of Geometries in the columnar format, with optional lists of
+    point clouds and normals of each world. The union meshes of the worlds are
+    computed into union_cache_dir, where loading the dataset finds them, unless
+    it is None
+    """
+    columns = {
+        "types": [],
+        "names": [],
+        "sizes": [],
+        "placements": [],
+        "parent_joints": [],
+        "parent_frames": [],
+        "colors": [],
+    }
+    offsets = [0]
+    for geoms in dataset_geoms:
+        for geom_obj in geoms.geom_objs:
+            props = utils.geom_to_dict(geom_obj.geometry)
+            if props["name"] not in GEOM_TYPES:
+                raise ValueError(f"{geom_obj.name} is not a primitive.")
+            if len(geom_obj.name) > NAME_LENGTH:
+                raise ValueError(f"{geom_obj.name} is longer than {NAME_LENGTH}.")
+            columns["types"].append(GEOM_TYPES[props["name"]])
+            columns["names"].append(geom_obj.name)
+            columns["sizes"].append(geom_size(props))
+            columns["placements"].append(geom_obj.placement.homogeneous)
+            columns["parent_joints"].append(geom_obj.parentJoint)
+            columns["parent_frames"].append(geom_obj.parentFrame)
+            columns["colors"].append(geom_obj.meshColor)
+        offsets.append(offsets[-1] + len(geoms.geom_objs))
+        if union_cache_dir is not None:
+            Geometries(geoms.geom_objs, union_cache_dir).compute_union_mesh()
+
+    os.makedirs(dirname, exist_ok=True)
+    arrays = {
+        "types": np.array(columns["types"], dtype=np.int8),
+        "names": np.array(columns["names"], dtype=f"<U{NAME_LENGTH}"),
+        "sizes": np.array(columns["sizes"]).reshape(-1, 3),
+        "placements": np.array(columns["placements"]).reshape(-1, 4, 4),
+        "parent_joints": np.array(columns["parent_joints"], dtype=np.int64),
+        "parent_frames": np.array(columns["parent_frames"], dtype=np.int64),
+        "colors": np.array(columns["colors"]).reshape(-1, 4),
+        "offsets": np.array(offsets, dtype=np.int64),
+    }
+    if points is not None:
+        if len(points) != len(dataset_geoms):
+            raise ValueError("There should be one point cloud per world.")
+        arrays["points"] = np.vstack(points)
+        arrays["point_offsets"] = np.cumsum([0] + [p.shape[0] for p in points])
+        if normals is not None:
+            arrays["normals"] = np.vstack(normals)
+    for key, array in arrays.items():
+        np.save(os.path.join(dirname, f"{key}.npy"), array)
+
+
+class GeometriesDataset:
+    """
+    Worlds of a columnar dataset, arrays are memory-mapped so that opening is
+    immediate and processes reading the same dataset share its pages.
+    Worlds are decoded to Geometries when indexed
+    """
+
+    def __init__(self, dirname, cache_dir=UNION_CACHE_DIR, lazy_union=False):
+        if not os.path.isdir(dirname):
+            raise ValueError(f"No dataset found: {dirname}")
+        self.dirname = dirname
+        self.cache_dir = cache_dir
+        self.lazy_union = lazy_union
+        for key in [
+            "types",
+            "names",
+            "sizes",
+            "placements",
+            "parent_joints",
+            "parent_frames",
+            "colors",
+            "offsets",
+        ]:
+            setattr(self, key, self.load(key))
+        self.points = self.load("points", required=False)
+        self.point_offsets = self.load("point_offsets", required=False)
+        self.normals = self.load("normals", required=False)
+
+    def load(self, key, required=True):
+        filename = os.path.join(self.dirname, f"{key}.npy")
+        if not required and not os.path.exists(filename):
+            return None
+        return np.load(filename, mmap_mode="r")
+
+    def __len__(self):
+        return self.offsets.shape[0] - 1
+
+    def __getitem__(self, idx):
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError(f"World {idx} out of range.")
+        start, end = self.offsets[idx], self.offsets[idx + 1]
+        geom_objs = []
+        for i in range(start, end):
+            props = {
+                "geom": size_to_props(GEOM_NAMES[self.types[i]], self.sizes[i]),
+                "name": str(self.names[i]),
+                "parentJoint": int(self.parent_joints[i]),
+                "parentFrame": int(self.parent_frames[i]),
+                "placement": np.array(self.placements[i]),
+                "meshPath": "",
+                "meshScale": np.ones(3),
+                "overrideMaterial": False,
+                "meshColor": np.array(self.colors[i]),
+                "meshTexturePath": "",
+            }
+            geom_objs.append(utils.dict_to_geom_obj(props))
+        geoms = Geometries(geom_objs, self.cache_dir, self.lazy_union)
+        if self.points is not None:
+            geoms.surface_pcd = self.point_cloud(idx)
+        return geoms
+
+    def point_cloud(self, idx):
+        """
+        precomputed point cloud of a world and its normals, None if not stored
+        """
+        if self.points is None:
+            return None, None
+        start, end = self.point_offsets[idx], self.point_offsets[idx + 1]
+        points = np.array(self.points[start:end])
+        normals = None
+        if self.normals is not None:
+            normals = np.array(self.normals[start:end])
+        return points, normals
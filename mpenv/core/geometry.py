@@ -1,18 +1,71 @@
+import os
+import hashlib
 import numpy as np
 import trimesh
 import logging
 
 from mpenv.core import utils
+from mpenv.core import primitives
 
 trimesh.util.attach_to_log(logging.ERROR)
 
+# union meshes shared by the environments, the datasets and their generation
+UNION_CACHE_DIR = os.path.join(utils.CACHE_DIR, "unions")
+
 
 class Geometries:
-    def __init__(self, geom_objs=None):
+    def __init__(self, geom_objs=None, cache_dir=None, lazy_union=False):
         if geom_objs is None:
             geom_objs = []
         self.geom_objs = geom_objs
         self.union_mesh = None
+        # union meshes are stored there, keyed by a hash of the geometries
+        self.cache_dir = cache_dir
+        # only compute the union mesh when it is read
+        self.lazy_union = lazy_union
+        # points and normals sampled beforehand on the surface, stored in a dataset
+        self.surface_pcd = None
+
+    @property
+    def union_mesh(self):
+        if self._union_mesh is None and self.lazy_union:
+            self.compute_union_mesh()
+        return self._union_mesh
+
+    @union_mesh.setter
+    def union_mesh(self, mesh):
+        self._union_mesh = mesh
+
+    @property
+    def geom_objs(self):
+        return self._geom_objs
+
+    @geom_objs.setter
+    def geom_objs(self, geom_objs):
+        self._geom_objs = geom_objs
+        self.invalidate()
+
+    def invalidate(self):
+        """
+        drop the cached scene and ray intersector, to call after modifying
+        the geometries or their placements in place
+        """
+        self._scene = None
+        self._scene_key = None
+        self._ray_intersector = None
+
+    def cache_key(self):
+        """
+        geometries the caches are built from, the key keeps references to them so
+        that their ids cannot be reused by new geometries
+        """
+        return tuple(self._geom_objs)
+
+    def cache_valid(self):
+        key = self._scene_key
+        if key is None or len(key) != len(self._geom_objs):
+            return False
+        return all(cached is geom_obj for cached, geom_obj in zip(key, self._geom_objs))
 
     def from_dict(self, state):
         self.union_mesh = state["mesh"]
@@ -23,9 +76,13 @@ class Geometries:
             self.geom_objs.append(geom_obj)
 
     def to_dict(self):
-        if self.union_mesh is None:
+        """
+        in lazy mode the union mesh is only stored if it was already computed,
+        it is computed back when read after from_dict
+        """
+        if self._union_mesh is None and not self.lazy_union:
             self.compute_union_mesh()
-        state = {"geom_props": [], "mesh": self.union_mesh}
+        state = {"geom_props": [], "mesh": self._union_mesh}
         for geom_obj in self.geom_objs:
             state["geom_props"].append(utils.geom_obj_to_dict(geom_obj))
         return state
@@ -37,17 +94,30 @@ class Geometries:
         return meshs
 
     def scene(self):
+        """
+        scene concatenating the meshes of the geometries with their face normals and
+        areas, cached until the geometry list changes or invalidate is called
+        """
+        if self._scene is not None and self.cache_valid():
+            return self._scene
+        self._ray_intersector = None
+
         scene = trimesh.Scene()
         meshs = self.compute_meshs()
-        vertices = np.zeros((0, 3))
-        tris = np.zeros((0, 3, 3))
-        faces = np.zeros((0, 3), dtype=int)
+        n_vertices = sum(mesh.vertices.shape[0] for mesh in meshs)
+        n_faces = sum(mesh.faces.shape[0] for mesh in meshs)
+        vertices = np.zeros((n_vertices, 3))
+        tris = np.zeros((n_faces, 3, 3))
+        faces = np.zeros((n_faces, 3), dtype=int)
+        i_vertex, i_face = 0, 0
         for mesh in meshs:
             scene.add_geometry(mesh)
-            n = vertices.shape[0]
-            vertices = np.vstack((vertices, mesh.vertices))
-            tris = np.vstack((tris, mesh.triangles))
-            faces = np.vstack((faces, mesh.faces + n))
+            n_v, n_f = mesh.vertices.shape[0], mesh.faces.shape[0]
+            vertices[i_vertex : i_vertex + n_v] = mesh.vertices
+            tris[i_face : i_face + n_f] = mesh.triangles
+            faces[i_face : i_face + n_f] = mesh.faces + i_vertex
+            i_vertex += n_v
+            i_face += n_f
         # compute face normals
         # scene.triangles = tris
         scene.vertices = vertices
@@ -57,33 +127,70 @@ class Geometries:
         unit_normals = normals / area_faces[:, None]
         scene.face_normals = unit_normals
         scene.area_faces = area_faces
+
+        self._scene = scene
+        self._scene_key = self.cache_key()
         return scene
 
+    def union_key(self):
+        """
+        hash of the geometries types, sizes, placements and mesh files
+        """
+        h = hashlib.sha1()
+        for geom_obj in self.geom_objs:
+            props = utils.geom_to_dict(geom_obj.geometry)
+            for key, value in sorted(props.items()):
+                h.update(key.encode())
+                h.update(np.asarray(value).tobytes())
+            h.update(geom_obj.placement.homogeneous.tobytes())
+            h.update(geom_obj.meshPath.encode())
+            h.update(np.asarray(geom_obj.meshScale, dtype=float).tobytes())
+        return h.hexdigest()
+
+    def union_cache_path(self):
+        return os.path.join(self.cache_dir, f"union_{self.union_key()}.npz")
+
     def compute_union_mesh(self):
         if len(self.geom_objs) == 0:
             return None
 
         meshs = self.compute_meshs()
+        if len(meshs) == 1:
+            self.union_mesh = meshs[0]
+            return
+
+        filename = None
+        if self.cache_dir is not None:
+            filename = self.union_cache_path()
+            if os.path.exists(filename):
+                data = np.load(filename)
+                self.union_mesh = trimesh.Trimesh(
+                    data["vertices"], data["faces"], process=False
+                )
+                return
+
         # costly function, takes ~0.1sec to 1sec to compute
-        if len(meshs) > 1:
-            print("computed union")
-            mesh = trimesh.boolean.union(meshs)
-        else:
-            mesh = meshs[0]
+        print("computed union")
+        mesh = trimesh.boolean.union(meshs)
 
+        if filename is not None:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # write then rename so that concurrent readers never see a partial file
+            tmp_filename = f"{filename}.{os.getpid()}.tmp.npz"
+            np.savez(tmp_filename, vertices=mesh.vertices, faces=mesh.faces)
+            os.replace(tmp_filename, filename)
         self.union_mesh = mesh
 
     def compute_origins_rays(self, rays_origins, rays):
-        origins = []
-        for point in rays_origins:
-            origins += [point] * rays.shape[0]
-        origins = np.array(origins)
+        origins = np.repeat(rays_origins, rays.shape[0], axis=0)
         rays = np.tile(rays, (rays_origins.shape[0], 1))
         return origins, rays
 
     def ray_intersector(self):
         scene = self.scene()
-        return trimesh.ray.ray_pyembree.RayMeshIntersector(scene), scene
+        if self._ray_intersector is None:
+            self._ray_intersector = trimesh.ray.ray_pyembree.RayMeshIntersector(scene)
+        return self._ray_intersector, scene
 
     def ray_intersections(self, ray_intersector, scene, origins, rays):
         points, ray_indices, tri_indices = ray_intersector.intersects_location(
@@ -101,30 +208,97 @@ class Geometries:
         p = (1 - np.sqrt(r1)) * a + (np.sqrt(r1) * (1 - r2)) * b + r2 * np.sqrt(r1) * c
         return p
 
+    def sampled_geometries(self):
+        """
+        each geometry as (geom, placement, mesh), primitives are sampled in closed form
+        in their frame and have no mesh, other geometries are sampled on their mesh
+        """
+        sampled = []
+        for geom_obj in self.geom_objs:
+            placement = utils.geometry_placement(geom_obj)
+            if primitives.is_primitive(geom_obj.geometry):
+                sampled.append((geom_obj.geometry, placement, None))
+            else:
+                sampled.append((None, placement, utils.mesh_from_geometry(geom_obj)))
+        return sampled
+
     def compute_surface_pcd(self, n_pts, min_dist=0.04):
-        scene = self.scene()
-        proba_faces = scene.area_faces
-        proba_faces = proba_faces / proba_faces.sum()
-        indices = np.random.choice(
-            np.arange(scene.faces.shape[0]), p=proba_faces, size=n_pts
+        if len(self.geom_objs) == 0:
+            return np.zeros((0, 3)), np.zeros((0, 3))
+
+        sampled = self.sampled_geometries()
+        areas = np.array(
+            [
+                primitives.surface_area(geom) if mesh is None else mesh.area
+                for geom, placement, mesh in sampled
+            ]
         )
-        faces = scene.faces[indices]
-        tris = scene.vertices[faces]
-        points = self.sample_uniformly_triangle(tris)
-        normals = scene.face_normals[indices]
-        return points, normals
+        counts = np.random.multinomial(n_pts, areas / areas.sum())
+        points, normals = [], []
+        for (geom, placement, mesh), count in zip(sampled, counts):
+            if mesh is None:
+                geom_points, geom_normals = primitives.sample_surface(geom, count)
+                rotation, translation = placement[:3, :3], placement[:3, 3]
+                points.append(geom_points.dot(rotation.T) + translation)
+                normals.append(geom_normals.dot(rotation.T))
+            else:
+                proba_faces = mesh.area_faces / mesh.area
+                indices = np.random.choice(
+                    mesh.faces.shape[0], p=proba_faces, size=count
+                )
+                points.append(self.sample_uniformly_triangle(mesh.triangles[indices]))
+                normals.append(mesh.face_normals[indices])
+        # samples are grouped by geometry, shuffle them as consumers may truncate
+        order = np.random.permutation(n_pts)
+        return np.vstack(points)[order], np.vstack(normals)[order]
 
     def compute_volume_pcd(self, n_points):
         if len(self.geom_objs) == 0:
             return np.zeros((0, 3)), np.zeros((0, 3))
 
-        # buggy function
-        # points = trimesh.sample.volume_mesh(self.union_mesh, 6 * n_points)
-        ray_intersector, scene = self.ray_intersector()
-        rand_points = (
-            np.random.random((6 * n_points, 3)) * scene.extents
-        ) + scene.bounds[0]
-        contains = ray_intersector.contains_points(rand_points)
-        points = rand_points[contains]
-        points, indices = utils.match_size(points, n_points)
-        return points
+        sampled = self.sampled_geometries()
+        volumes = np.array(
+            [
+                primitives.volume(geom) if mesh is None else mesh.volume
+                for geom, placement, mesh in sampled
+            ]
+        )
+        points = []
+        n_accepted = 0
+        while n_accepted < n_points:
+            counts = np.random.multinomial(n_points, volumes / volumes.sum())
+            candidates = np.vstack(
+                [
+                    self.sample_volume(geom, placement, mesh, count)
+                    for (geom, placement, mesh), count in zip(sampled, counts)
+                ]
+            )
+            # points in k geometries are sampled k times as often, keep them with
+            # probability 1 / k so that points are uniform in the union of the volumes
+            n_inside = np.zeros(n_points)
+            for geom, placement, mesh in sampled:
+                n_inside += self.contains(geom, placement, mesh, candidates)
+            n_inside = np.maximum(n_inside, 1)
+            keep = np.random.uniform(0, 1, n_points) * n_inside < 1
+            points.append(candidates[keep])
+            n_accepted += keep.sum()
+        points = np.vstack(points)
+        order = np.random.permutation(points.shape[0])[:n_points]
+        return points[order]
+
+    def sample_volume(self, geom, placement, mesh, n):
+        if mesh is None:
+            points = primitives.sample_volume(geom, n)
+            return points.dot(placement[:3, :3].T) + placement[:3, 3]
+        # rejection sampling in the bounding box of the mesh
+        points = np.zeros((0, 3))
+        while points.shape[0] < n:
+            candidates = np.random.uniform(*mesh.bounds, (2 * n, 3))
+            points = np.vstack((points, candidates[mesh.contains(candidates)]))
+        return points[:n]
+
+    def contains(self, geom, placement, mesh, points):
+        if mesh is None:
+            local_points = (points - placement[:3, 3]).dot(placement[:3, :3])
+            return primitives.contains(geom, local_points)
+        return mesh.contains(points)
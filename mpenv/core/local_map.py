@@ -0,0 +1,103 @@
+import numpy as np
+
+# bits per voxel coordinate in the keys, coordinates are offset to stay positive
+KEY_BITS = 21
+KEY_OFFSET = 1 << (KEY_BITS - 1)
+
+
+class LocalMap:
+    """
+    Voxel hashed map of points and their normals, each voxel of size voxel_size keeps
+    the first point observed in it. Points far from the robot are evicted so that
+    the map stays bounded. Points are stored in slots, the slots of evicted points
+    are reused and slots maps each voxel key to the slot of its point
+    """
+
+    def __init__(self, voxel_size):
+        if voxel_size <= 0:
+            raise ValueError("voxel_size should be positive.")
+        self.voxel_size = voxel_size
+        self.clear()
+
+    def clear(self):
+        self.slots = {}
+        self.free = []
+        self.size = 0
+        self.keys = np.zeros(0, dtype=np.int64)
+        self.points = np.zeros((0, 3))
+        self.normals = np.zeros((0, 3))
+        self.alive = np.zeros(0, dtype=bool)
+
+    def __len__(self):
+        return len(self.slots)
+
+    def voxel_keys(self, points):
+        voxels = np.floor(points / self.voxel_size).astype(np.int64) + KEY_OFFSET
+        return (voxels[:, 0] << 2 * KEY_BITS) | (voxels[:, 1] << KEY_BITS) | voxels[:, 2]
+
+    def allocate(self, n):
+        """
+        n slots, free slots first, the slot arrays grow by doubling
+        """
+        n_reused = min(n, len(self.free))
+        reused = self.free[len(self.free) - n_reused :]
+        del self.free[len(self.free) - n_reused :]
+        start = self.size
+        self.size += n - n_reused
+        capacity = self.keys.shape[0]
+        if self.size > capacity:
+            capacity = max(self.size, 2 * capacity)
+            extra = capacity - self.keys.shape[0]
+            self.keys = np.concatenate((self.keys, np.zeros(extra, dtype=np.int64)))
+            self.points = np.vstack((self.points, np.zeros((extra, 3))))
+            self.normals = np.vstack((self.normals, np.zeros((extra, 3))))
+            self.alive = np.concatenate((self.alive, np.zeros(extra, dtype=bool)))
+        return np.concatenate(
+            (np.array(reused, dtype=np.int64), np.arange(start, self.size))
+        )
+
+    def insert(self, points, normals):
+        """
+        add the points falling in voxels of the map which are still empty,
+        returns the number of points added. The cost only depends on the number
+        of points inserted, not on the size of the map
+        """
+        keys, first = np.unique(self.voxel_keys(points), return_index=True)
+        # keep the observation order of the new points
+        order = np.argsort(first)
+        keys, first = keys[order], first[order]
+        new = np.array([key not in self.slots for key in keys.tolist()], dtype=bool)
+        keys, added = keys[new], first[new]
+        slots = self.allocate(added.shape[0])
+        self.keys[slots] = keys
+        self.points[slots] = points[added]
+        self.normals[slots] = normals[added]
+        self.alive[slots] = True
+        self.slots.update(zip(keys.tolist(), slots.tolist()))
+        return added.shape[0]
+
+    def evict(self, center, radius):
+        """
+        remove the points at distance radius or more from center
+        """
+        alive = np.flatnonzero(self.alive[: self.size])
+        distances = np.linalg.norm(self.points[alive] - center, axis=1)
+        far = alive[distances >= radius]
+        self.alive[far] = False
+        for key in self.keys[far].tolist():
+            del self.slots[key]
+        self.free.extend(far.tolist())
+
+    def nearest(self, center, n):
+        """
+        the n points of the map closest to center and their normals, closest first
+        """
+        alive = np.flatnonzero(self.alive[: self.size])
+        distances = np.linalg.norm(self.points[alive] - center, axis=1)
+        if alive.shape[0] > n:
+            closest = np.argpartition(distances, n - 1)[:n]
+        else:
+            closest = np.arange(alive.shape[0])
+        closest = closest[np.argsort(distances[closest], kind="stable")]
+        indices = alive[closest]
+        return self.points[indices], self.normals[indices]
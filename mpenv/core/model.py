@@ -1,7 +1,10 @@
+import itertools
 import numpy as np
 
 import pinocchio as pin
 
+from mpenv.core.spatial_hash import SpatialHash
+
 
 class ModelWrapper:
     """
@@ -18,6 +21,9 @@ class ModelWrapper:
         self._geom_model = geom_model
         self._data = None
         self._geom_data = None
+        self._motion_radii = {}
+        self._broadphase = None
+        self._collision_labels = np.zeros(0, dtype=bool)
         self._clip_bounds = (None, None)
 
     def configuration(self, q):
@@ -38,6 +44,160 @@ class ModelWrapper:
     def create_data(self):
         self._data = self._model.createData()
         self._geom_data = self._geom_model.createData()
+        self._motion_radii = self.compute_motion_radii()
+        self._broadphase = None
+        n_geoms = len(self._geom_model.geometryObjects)
+        self._collision_labels = np.zeros(n_geoms, dtype=bool)
+
+    def compute_motion_radii(self):
+        """
+        radius of a sphere centered on the parent joint containing each geometry
+        attached to a moving joint, used to bound the motion of the geometries
+        """
+        motion_radii = {}
+        for geom_id, geom_obj in enumerate(self._geom_model.geometryObjects):
+            if geom_obj.parentJoint == 0:
+                continue
+            geom = geom_obj.geometry
+            geom.computeLocalAABB()
+            center = geom_obj.placement.act(geom.aabb_center)
+            motion_radii[geom_id] = np.linalg.norm(center) + geom.aabb_radius
+        return motion_radii
+
+    @property
+    def broadphase_enabled(self):
+        return self._broadphase is not None
+
+    def geometry_aabb(self, geom_id, oMg):
+        """
+        world AABB of a geometry placed at oMg, returns its lower and upper corners
+        """
+        geom = self._geom_model.geometryObjects[geom_id].geometry
+        geom.computeLocalAABB()
+        aabb = geom.aabb_local
+        corners = np.array(list(itertools.product(*zip(aabb.min_, aabb.max_))))
+        corners = corners.dot(oMg.rotation.T) + oMg.translation
+        return corners.min(0), corners.max(0)
+
+    def enable_broadphase(self, cell_size=None):
+        """
+        Hash the AABBs of the static geometries in a uniform grid so that only
+        the collision pairs whose AABBs overlap reach narrow-phase, other pairs
+        between moving and static geometries are deactivated before each check.
+        Static geometries must not move while the broad-phase is enabled,
+        enable it again after updating them.
+        """
+        self.disable_broadphase()
+        geom_model = self._geom_model
+        geom_data = self._geom_data
+        geom_objs = geom_model.geometryObjects
+        pairs = []
+        static_ids = []
+        for pair_id, (cp, active) in enumerate(
+            zip(geom_model.collisionPairs, geom_data.activeCollisionPairs)
+        ):
+            first_static = geom_objs[cp.first].parentJoint == 0
+            second_static = geom_objs[cp.second].parentJoint == 0
+            if not active or first_static == second_static:
+                continue
+            moving_id, static_id = cp.first, cp.second
+            if first_static:
+                moving_id, static_id = static_id, moving_id
+            placement = geom_objs[static_id].placement
+            lo, hi = self.geometry_aabb(static_id, placement)
+            # unbounded geometries are always checked
+            if not (np.isfinite(lo).all() and np.isfinite(hi).all()):
+                continue
+            if static_id not in static_ids:
+                static_ids.append(static_id)
+            pairs.append((pair_id, moving_id, static_id))
+        if len(pairs) == 0:
+            return
+
+        moving_ids = sorted(set(moving_id for _, moving_id, _ in pairs))
+        centers = np.zeros((len(moving_ids), 3))
+        radii = np.zeros(len(moving_ids))
+        for i, moving_id in enumerate(moving_ids):
+            geom = geom_objs[moving_id].geometry
+            geom.computeLocalAABB()
+            centers[i] = geom.aabb_center
+            radii[i] = geom.aabb_radius
+        aabbs = [self.geometry_aabb(i, geom_objs[i].placement) for i in static_ids]
+        static_lo = np.array([aabb[0] for aabb in aabbs])
+        static_hi = np.array([aabb[1] for aabb in aabbs])
+        if cell_size is None:
+            # cells fit the moving geometries and the typical obstacle
+            extent = np.median((static_hi - static_lo).max(1))
+            cell_size = max(2 * radii.max(), extent)
+        spatial_hash = SpatialHash(cell_size)
+        spatial_hash.insert(static_lo, static_hi)
+
+        # pair_table[i, j] is the pair between moving i and static j, -1 if none
+        pair_table = np.full((len(moving_ids), len(static_ids)), -1, dtype=int)
+        for pair_id, moving_id, static_id in pairs:
+            i, j = moving_ids.index(moving_id), static_ids.index(static_id)
+            pair_table[i, j] = pair_id
+        self._broadphase = {
+            "hash": spatial_hash,
+            "moving_ids": moving_ids,
+            "centers": centers,
+            "radii": radii,
+            "pair_table": pair_table,
+            "pairs": [pair_id for pair_id, _, _ in pairs],
+            "active": set(pair_id for pair_id, _, _ in pairs),
+        }
+        filtered = set(self._broadphase["pairs"])
+        n_pairs = len(geom_model.collisionPairs)
+        self._broadphase["unfiltered"] = [
+            pair_id for pair_id in range(n_pairs) if pair_id not in filtered
+        ]
+
+    def disable_broadphase(self):
+        """
+        restore the collision pairs deactivated by the broad-phase
+        """
+        if self._broadphase is None:
+            return
+        active = self._broadphase["active"]
+        for pair_id in self._broadphase["pairs"]:
+            if pair_id not in active:
+                self._geom_data.activateCollisionPair(pair_id)
+        self._broadphase = None
+
+    def moving_aabbs(self):
+        """
+        bounding boxes of the moving geometries filtered by the broad-phase
+        at the current geometry placements, returns arrays of shape (k, 3)
+        """
+        broadphase = self._broadphase
+        oMg = self._geom_data.oMg
+        centers = np.zeros((len(broadphase["moving_ids"]), 3))
+        for i, moving_id in enumerate(broadphase["moving_ids"]):
+            placement = oMg[moving_id]
+            centers[i] = placement.rotation.dot(broadphase["centers"][i])
+            centers[i] += placement.translation
+        radii = broadphase["radii"][:, None]
+        return centers - radii, centers + radii
+
+    def update_broadphase(self, lo, hi):
+        """
+        activate only the pairs whose static geometry AABB overlaps the box [lo, hi]
+        of their moving geometry, lo and hi are of shape (k, 3) as in moving_aabbs
+        """
+        broadphase = self._broadphase
+        spatial_hash = broadphase["hash"]
+        pair_table = broadphase["pair_table"]
+        active = set()
+        for i in range(len(broadphase["moving_ids"])):
+            static_idx = spatial_hash.query(lo[i], hi[i])
+            pair_ids = pair_table[i, static_idx]
+            active.update(pair_ids[pair_ids >= 0].tolist())
+        geom_data = self._geom_data
+        for pair_id in broadphase["active"] - active:
+            geom_data.deactivateCollisionPair(pair_id)
+        for pair_id in active - broadphase["active"]:
+            geom_data.activateCollisionPair(pair_id)
+        broadphase["active"] = active
 
     def collision(self, qw):
         if isinstance(qw, ConfigurationWrapper):
@@ -60,30 +220,208 @@ class ModelWrapper:
         geom_data = self._geom_data
         pin.forwardKinematics(model, data, q)
         pin.updateGeometryPlacements(model, data, geom_model, geom_data)
-        qw.oMi = data.oMi.tolist()
-        qw.oMg = geom_data.oMg.tolist()
+        qw.oMi = placements_array(data.oMi)
+        qw.oMg = placements_array(geom_data.oMg)
+        if self._broadphase is not None:
+            self.update_broadphase(*self.moving_aabbs())
         # stop at the first collision
         collide = pin.computeCollisions(geom_model, geom_data, True)
         return collide
 
+    def collision_batch(self, qs, stop_at_first=False):
+        """
+        Check a batch of configuration vectors qs of shape (N, nq) for collisions
+        returns a boolean vector of shape (N,) and the index of the first colliding row,
+        None if every row is collision free.
+        If stop_at_first, rows following the first collision are not checked.
+        """
+        qs = np.asarray(qs)
+        if qs.ndim != 2 or qs.shape[1] != self._model.nq:
+            raise ValueError(
+                f"The given configurations are of shape {qs.shape} while \
+                the model requires configurations of shape (N, {self._model.nq})"
+            )
+        model = self._model
+        data = self._data
+        geom_model = self._geom_model
+        geom_data = self._geom_data
+        if self._broadphase is not None and qs.shape[0] > 0:
+            # a single broad-phase query for the boxes swept along the batch
+            lo, hi = np.inf, -np.inf
+            for q in qs:
+                pin.forwardKinematics(model, data, q)
+                pin.updateGeometryPlacements(model, data, geom_model, geom_data)
+                lo_q, hi_q = self.moving_aabbs()
+                lo, hi = np.minimum(lo, lo_q), np.maximum(hi, hi_q)
+            self.update_broadphase(lo, hi)
+        collide = np.zeros(qs.shape[0], dtype=bool)
+        first_idx = None
+        for i, q in enumerate(qs):
+            # forward kinematics, geometry placements and collisions in a single call
+            if pin.computeCollisions(model, data, geom_model, geom_data, q, True):
+                collide[i] = True
+                if first_idx is None:
+                    first_idx = i
+                    if stop_at_first:
+                        break
+        return collide, first_idx
+
+    def motion_bound(self, v):
+        """
+        upper bound on the displacement of any point of the moving geometries
+        along the motion q(t) = integrate(q0, t * v), t in [0, 1]
+        """
+        model = self._model
+        bound = 0
+        for geom_id, radius in self._motion_radii.items():
+            joint_id = self._geom_model.geometryObjects[geom_id].parentJoint
+            joint = model.joints[joint_id]
+            if model.parents[joint_id] != 0 or joint.nv != 6:
+                raise ValueError(
+                    "Continuous collision checking only supports free-flyer robots."
+                )
+            v_joint = v[joint.idx_v : joint.idx_v + joint.nv]
+            linear, angular = v_joint[:3], v_joint[3:]
+            bound_geom = np.linalg.norm(linear) + np.linalg.norm(angular) * radius
+            bound = max(bound, bound_geom)
+        return bound
+
+    def continuous_collision(
+        self, q0, q1, tolerance=1e-4, max_iterations=100, delta=1e-2
+    ):
+        """
+        Conservative advancement along the interpolated motion from q0 to q1
+        returns the time of first contact t in [0, 1], None if the motion is
+        collision free, and the collision labels at contact.
+        The configuration interpolated at t is collision free and at most at distance
+        tolerance from the obstacles. When q0 is already closer than tolerance,
+        contact is detected at half its distance so that moving away stays possible.
+        If the advancement does not converge in max_iterations, e.g. when sliding
+        along an obstacle, the rest of the motion is sampled with spacing delta
+        """
+        model = self._model
+        data = self._data
+        geom_model = self._geom_model
+        geom_data = self._geom_data
+        collision_labels = self.empty_collision_labels()
+        if len(geom_model.collisionPairs) == 0:
+            return None, collision_labels
+
+        v = pin.difference(model, q0, q1)
+        bound = self.motion_bound(v)
+        if self._broadphase is not None:
+            # the geometries stay within distance bound of their initial placement
+            pin.forwardKinematics(model, data, q0)
+            pin.updateGeometryPlacements(model, data, geom_model, geom_data)
+            lo, hi = self.moving_aabbs()
+            margin = bound + tolerance
+            self.update_broadphase(lo - margin, hi + margin)
+        t = 0.0
+        threshold = tolerance
+        for i in range(max_iterations):
+            q = pin.interpolate(model, q0, q1, t)
+            pair_idx = pin.computeDistances(model, data, geom_model, geom_data, q)
+            if pair_idx >= len(geom_model.collisionPairs):
+                # every collision pair is inactive
+                return None, collision_labels
+            dist = geom_data.distanceResults[pair_idx].min_distance
+            if i == 0:
+                if dist <= 0:
+                    break
+                threshold = min(tolerance, dist / 2)
+            if dist <= threshold:
+                break
+            if bound == 0:
+                return None, collision_labels
+            # no contact can happen before the geometries travelled dist, steps of at
+            # least threshold stay below dist and bound the number of iterations
+            t += max(dist - threshold / 2, threshold) / bound
+            if t >= 1:
+                return None, collision_labels
+        else:
+            return self.sampled_collision(q0, q1, t, delta)
+        # contact, label the pairs closer than the threshold
+        cps = geom_model.collisionPairs
+        drs = geom_data.distanceResults
+        active = geom_data.activeCollisionPairs
+        for cp, dr, cp_active in zip(cps, drs, active):
+            if cp_active and dr.min_distance <= max(dist, threshold):
+                collision_labels[cp.first] = True
+                collision_labels[cp.second] = True
+        return t, collision_labels
+
+    def sampled_collision(self, q0, q1, t0, delta):
+        """
+        Contact along the interpolated motion from q0 to q1 after time t0 checked on
+        configurations spaced by delta, returns the time of the last free
+        configuration before the first collision, None if every configuration is
+        collision free, and the collision labels of the first colliding pair
+        """
+        model = self._model
+        q = pin.interpolate(model, q0, q1, t0)
+        d = pin.distance(model, q, q1)
+        n_pts = max(int(np.ceil(d / delta)), 1) + 1
+        ts = np.linspace(t0, 1, num=n_pts)
+        qs = np.array([pin.interpolate(model, q0, q1, t) for t in ts])
+        _, first_idx = self.collision_batch(qs[1:], stop_at_first=True)
+        if first_idx is None:
+            return None, self.empty_collision_labels()
+        # qs[first_idx + 1] is the first configuration in collision
+        return ts[first_idx], self.collision_labels()
+
     def collision_pairs(self):
         cps = self.geom_model.collisionPairs
         crs = self.geom_data.collisionResults
+        active = self.geom_data.activeCollisionPairs
         pairs = []
         results = []
-        for cp, cr in zip(cps, crs):
+        if self._broadphase is not None:
+            # pairs filtered out by the broad-phase are not colliding
+            broadphase = self._broadphase
+            pair_ids = sorted(broadphase["active"].union(broadphase["unfiltered"]))
+            for pair_id in pair_ids:
+                cp = cps[pair_id]
+                pairs.append((cp.first, cp.second))
+                results.append(active[pair_id] and crs[pair_id].isCollision())
+            return pairs, results
+        for cp, cr, cp_active in zip(cps, crs, active):
             pairs.append((cp.first, cp.second))
-            results.append(cr.isCollision())
+            results.append(cp_active and cr.isCollision())
         return pairs, results
 
+    def empty_collision_labels(self):
+        """
+        collision labels array preallocated by create_data and reused across checks,
+        copy it to keep labels after the next check
+        """
+        collision_labels = self._collision_labels
+        collision_labels[:] = False
+        return collision_labels
+
     def collision_labels(self):
-        pairs, results = self.collision_pairs()
-        n_geoms = len(self.geom_model.geometryObjects)
-        collision_labels = np.zeros(n_geoms, dtype=bool)
-        for pair, result in zip(pairs, results):
-            if result:
-                collision_labels[pair[0]] = True
-                collision_labels[pair[1]] = True
+        """
+        labels of the geometries of the first colliding pair of the last check
+        """
+        collision_labels = self.empty_collision_labels()
+        cps = self.geom_model.collisionPairs
+        crs = self.geom_data.collisionResults
+        active = self.geom_data.activeCollisionPairs
+        if self._broadphase is None:
+            results = zip(crs, active)
+            pair_ids = range(len(cps))
+        else:
+            # pairs filtered out by the broad-phase are not colliding
+            broadphase = self._broadphase
+            pair_ids = sorted(broadphase["active"].union(broadphase["unfiltered"]))
+            results = ((crs[pair_id], active[pair_id]) for pair_id in pair_ids)
+        for pair_id, (cr, cp_active) in zip(pair_ids, results):
+            if cp_active and cr.isCollision():
+                cp = cps[pair_id]
+                collision_labels[cp.first] = True
+                collision_labels[cp.second] = True
+                # collisions are checked up to the first colliding pair,
+                # results of the following pairs are left from previous checks
+                break
         return collision_labels
 
     def distance(self, qw0, qw1):
@@ -94,16 +432,26 @@ class ModelWrapper:
         """
         return points from q0 to q1 evenly spaced with distance delta
         """
+        qs = self.arange_q(qw0, qw1, delta)
+        path = [ConfigurationWrapper(self, q) for q in qs]
+        return path
+
+    def arange_q(self, qw0, qw1, delta):
+        """
+        return configuration vectors from q0 to q1 evenly spaced with distance delta
+        stacked in an array of shape (n_pts, nq)
+        """
         model = self._model
-        d = self.distance(qw0, qw1)
+        q0, q1 = qw0.q, qw1.q
+        d = pin.distance(model, q0, q1)
         # ensure at least one point is generated
         d = max(d, delta)
         n_pts = np.ceil(d / delta).astype(int)
         steps = np.linspace(0, 1, num=n_pts, endpoint=True)
-        path = []
+        qs = np.zeros((n_pts, model.nq))
         for i, t in enumerate(steps):
-            path.append(self.interpolate(qw0, qw1, t))
-        return path
+            qs[i] = pin.interpolate(model, q0, q1, t)
+        return qs
 
     def interpolate(self, qw0, qw1, t):
         q0, q1 = qw0.q, qw1.q
@@ -165,7 +513,7 @@ class ModelWrapper:
         model = self._model
         data = self._data
         pin.forwardKinematics(model, data, q)
-        qw.oMi = data.oMi.tolist()
+        qw.oMi = placements_array(data.oMi)
 
     def compute_oMg(self, qw):
         q = qw.q
@@ -175,7 +523,7 @@ class ModelWrapper:
         geom_data = self._geom_data
         pin.forwardKinematics(model, data, q)
         pin.updateGeometryPlacements(model, data, geom_model, geom_data, q)
-        qw.oMg = geom_data.oMg.tolist()
+        qw.oMg = placements_array(geom_data.oMg)
 
     def copy(self):
         return self.__copy__()
@@ -184,12 +532,25 @@ class ModelWrapper:
         return ModelWrapper(self._model.copy(), self._geom_model.copy())
 
 
+def placements_array(placements):
+    """
+    stack a vector of pin.SE3 into a read-only array of shape (n, 4, 4)
+    """
+    placements = np.array([M.homogeneous for M in placements])
+    placements.flags.writeable = False
+    return placements
+
+
 class ConfigurationWrapper:
     """
     Wrapper to avoid repeated computations associated to a configuration,
-    update only the position of joints and geometries when needed
+    update only the position of joints and geometries when needed.
+    q is stored as a read-only copy, oMi and oMg as read-only arrays
+    of shape (n, 4, 4)
     """
 
+    __slots__ = ("_model_wrapper", "_q", "_oMi", "_oMg")
+
     def __init__(self, model_wrapper, q):
         # updated is True if oMi/oMg corresponds to the current q
         self._model_wrapper = model_wrapper
@@ -202,7 +563,7 @@ class ConfigurationWrapper:
 
     @property
     def q(self):
-        return self._q.copy()
+        return self._q
 
     @property
     def oMi(self):
@@ -222,6 +583,9 @@ class ConfigurationWrapper:
 
     @q.setter
     def q(self, q):
+        # own a read-only copy, the cached placements stay valid for its lifetime
+        q = np.array(q, dtype=float, copy=True)
+        q.flags.writeable = False
         self._q = q
         self._oMi = None
         self._oMg = None
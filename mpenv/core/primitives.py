@@ -0,0 +1,183 @@
+import numpy as np
+import hppfcl
+
+"""
+Closed form samplers for hppfcl primitives, in the frame of the primitive.
+Cylinders, capsules and cones have their axis along z and are centered at the origin,
+cones have their base at -halfLength and their apex at +halfLength
+"""
+
+PRIMITIVES = (hppfcl.Box, hppfcl.Sphere, hppfcl.Cylinder, hppfcl.Capsule, hppfcl.Cone)
+
+
+def is_primitive(geom):
+    return isinstance(geom, PRIMITIVES)
+
+
+def check_primitive(geom):
+    if not is_primitive(geom):
+        raise ValueError(f"Unsupported geometry type for {type(geom)}")
+
+
+def surface_areas(geom):
+    """
+    areas of the parts of the surface sampled by sample_surface
+    """
+    check_primitive(geom)
+    if isinstance(geom, hppfcl.Box):
+        hx, hy, hz = geom.halfSide
+        return 4 * np.array([hy * hz, hy * hz, hx * hz, hx * hz, hx * hy, hx * hy])
+    elif isinstance(geom, hppfcl.Sphere):
+        return np.array([4 * np.pi * geom.radius ** 2])
+    r, hl = geom.radius, geom.halfLength
+    if isinstance(geom, hppfcl.Cylinder):
+        return np.array([4 * np.pi * r * hl, np.pi * r ** 2, np.pi * r ** 2])
+    elif isinstance(geom, hppfcl.Capsule):
+        return np.array([4 * np.pi * r * hl, 4 * np.pi * r ** 2])
+    elif isinstance(geom, hppfcl.Cone):
+        slant = np.hypot(r, 2 * hl)
+        return np.array([np.pi * r * slant, np.pi * r ** 2])
+
+
+def surface_area(geom):
+    return surface_areas(geom).sum()
+
+
+def volume(geom):
+    check_primitive(geom)
+    if isinstance(geom, hppfcl.Box):
+        return 8 * np.prod(geom.halfSide)
+    elif isinstance(geom, hppfcl.Sphere):
+        return 4 / 3 * np.pi * geom.radius ** 3
+    r, hl = geom.radius, geom.halfLength
+    if isinstance(geom, hppfcl.Cylinder):
+        return 2 * np.pi * r ** 2 * hl
+    elif isinstance(geom, hppfcl.Capsule):
+        return 2 * np.pi * r ** 2 * hl + 4 / 3 * np.pi * r ** 3
+    elif isinstance(geom, hppfcl.Cone):
+        return 2 / 3 * np.pi * r ** 2 * hl
+
+
+def random_directions(n):
+    directions = np.random.normal(size=(n, 3))
+    return directions / np.linalg.norm(directions, axis=1, keepdims=True)
+
+
+def random_disk(n, radius):
+    """
+    points of shape (n, 2) uniformly sampled in a disk
+    """
+    rho = radius * np.sqrt(np.random.uniform(0, 1, n))
+    theta = np.random.uniform(0, 2 * np.pi, n)
+    return np.stack((rho * np.cos(theta), rho * np.sin(theta)), axis=1)
+
+
+def sample_surface(geom, n):
+    """
+    n points uniformly sampled on the surface of a primitive and their outward normals
+    """
+    areas = surface_areas(geom)
+    parts = np.random.choice(areas.shape[0], size=n, p=areas / areas.sum())
+    points = np.zeros((n, 3))
+    normals = np.zeros((n, 3))
+    if isinstance(geom, hppfcl.Box):
+        # parts are the faces -x, +x, -y, +y, -z, +z
+        h = np.array(geom.halfSide)
+        points = np.random.uniform(-h, h, (n, 3))
+        axis, side = parts // 2, 2 * (parts % 2) - 1
+        rows = np.arange(n)
+        points[rows, axis] = side * h[axis]
+        normals[rows, axis] = side
+    elif isinstance(geom, hppfcl.Sphere):
+        normals = random_directions(n)
+        points = geom.radius * normals
+    elif isinstance(geom, (hppfcl.Cylinder, hppfcl.Capsule)):
+        r, hl = geom.radius, geom.halfLength
+        theta = np.random.uniform(0, 2 * np.pi, n)
+        normals[:, 0], normals[:, 1] = np.cos(theta), np.sin(theta)
+        points[:, :2] = r * normals[:, :2]
+        points[:, 2] = np.random.uniform(-hl, hl, n)
+        caps = parts > 0
+        n_caps = caps.sum()
+        if isinstance(geom, hppfcl.Cylinder):
+            side = np.where(parts[caps] == 1, -1, 1)
+            points[caps, :2] = random_disk(n_caps, r)
+            points[caps, 2] = side * hl
+            normals[caps] = 0
+            normals[caps, 2] = side
+        else:
+            # the two hemispheres make a sphere split along z
+            normals[caps] = random_directions(n_caps)
+            points[caps] = r * normals[caps]
+            points[caps, 2] += np.where(normals[caps, 2] < 0, -hl, hl)
+    elif isinstance(geom, hppfcl.Cone):
+        r, hl = geom.radius, geom.halfLength
+        # the lateral radius grows linearly from the apex
+        t = np.sqrt(np.random.uniform(0, 1, n))
+        theta = np.random.uniform(0, 2 * np.pi, n)
+        cos, sin = np.cos(theta), np.sin(theta)
+        points = np.stack((r * t * cos, r * t * sin, hl - 2 * hl * t), axis=1)
+        normals = np.stack((2 * hl * cos, 2 * hl * sin, np.full(n, r)), axis=1)
+        normals /= np.hypot(r, 2 * hl)
+        base = parts == 1
+        points[base, :2] = random_disk(base.sum(), r)
+        points[base, 2] = -hl
+        normals[base] = [0, 0, -1]
+    return points, normals
+
+
+def sample_volume(geom, n):
+    """
+    n points uniformly sampled in the volume of a primitive
+    """
+    check_primitive(geom)
+    if isinstance(geom, hppfcl.Box):
+        h = np.array(geom.halfSide)
+        return np.random.uniform(-h, h, (n, 3))
+    elif isinstance(geom, hppfcl.Sphere):
+        rho = geom.radius * np.cbrt(np.random.uniform(0, 1, n))
+        return rho[:, None] * random_directions(n)
+    r, hl = geom.radius, geom.halfLength
+    points = np.zeros((n, 3))
+    if isinstance(geom, hppfcl.Cylinder):
+        points[:, :2] = random_disk(n, r)
+        points[:, 2] = np.random.uniform(-hl, hl, n)
+    elif isinstance(geom, hppfcl.Capsule):
+        cylinder_volume = 2 * np.pi * r ** 2 * hl
+        in_cylinder = np.random.uniform(0, volume(geom), n) < cylinder_volume
+        n_cylinder = in_cylinder.sum()
+        points[in_cylinder, :2] = random_disk(n_cylinder, r)
+        points[in_cylinder, 2] = np.random.uniform(-hl, hl, n_cylinder)
+        # the two half balls make a ball split along z
+        n_ball = n - n_cylinder
+        rho = r * np.cbrt(np.random.uniform(0, 1, n_ball))
+        ball = rho[:, None] * random_directions(n_ball)
+        ball[:, 2] += np.where(ball[:, 2] < 0, -hl, hl)
+        points[~in_cylinder] = ball
+    elif isinstance(geom, hppfcl.Cone):
+        # the section area grows quadratically from the apex
+        t = np.cbrt(np.random.uniform(0, 1, n))
+        points[:, :2] = t[:, None] * random_disk(n, r)
+        points[:, 2] = hl - 2 * hl * t
+    return points
+
+
+def contains(geom, points):
+    """
+    boolean mask of the points of shape (n, 3) inside a primitive
+    """
+    check_primitive(geom)
+    if isinstance(geom, hppfcl.Box):
+        return (np.abs(points) <= geom.halfSide).all(axis=1)
+    elif isinstance(geom, hppfcl.Sphere):
+        return np.linalg.norm(points, axis=1) <= geom.radius
+    r, hl = geom.radius, geom.halfLength
+    x, y, z = points[:, 0], points[:, 1], points[:, 2]
+    rho = np.hypot(x, y)
+    if isinstance(geom, hppfcl.Cylinder):
+        return (rho <= r) & (np.abs(z) <= hl)
+    elif isinstance(geom, hppfcl.Capsule):
+        dz = z - np.clip(z, -hl, hl)
+        return np.hypot(rho, dz) <= r
+    elif isinstance(geom, hppfcl.Cone):
+        return (np.abs(z) <= hl) & (2 * hl * rho <= r * (hl - z))
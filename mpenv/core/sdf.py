@@ -0,0 +1,80 @@
+import numpy as np
+
+from mpenv.core import boxes2d
+
+
+class SDF2D:
+    """
+    Signed distance field sampled on a regular grid over bounds [[x_min, y_min],
+    [x_max, y_max]], values[i, j] is the signed distance at x_i, y_j.
+    Clearance lookups interpolate bilinearly, they are exact up to max_error
+    since signed distances are 1-Lipschitz
+    """
+
+    def __init__(self, values, bounds):
+        self.values = values
+        self.bounds = np.asarray(bounds, dtype=float)
+        self.shape = values.shape
+        self.cell_size = (self.bounds[1] - self.bounds[0]) / (np.array(self.shape) - 1)
+        self.max_error = np.linalg.norm(self.cell_size)
+        # python floats make scalar lookups several times cheaper than numpy indexing
+        self._values_list = values.tolist()
+        self._origin = self.bounds[0].tolist()
+        self._cell_size = self.cell_size.tolist()
+
+    @classmethod
+    def from_boxes(cls, boxes, bounds, resolution):
+        """
+        grid of resolution x resolution nodes of the signed distance to boxes
+        """
+        bounds = np.asarray(bounds, dtype=float)
+        xs = np.linspace(bounds[0, 0], bounds[1, 0], resolution)
+        ys = np.linspace(bounds[0, 1], bounds[1, 1], resolution)
+        grid = np.stack(np.meshgrid(xs, ys, indexing="ij"), -1).reshape(-1, 2)
+        values = boxes2d.points_signed_distance(grid, boxes)
+        return cls(values.reshape(resolution, resolution), bounds)
+
+    @classmethod
+    def load(cls, filename):
+        data = np.load(filename)
+        return cls(data["values"], data["bounds"])
+
+    def save(self, filename):
+        np.savez(filename, values=self.values, bounds=self.bounds)
+
+    def clearance(self, points):
+        """
+        interpolated signed distance at points of shape (m, 2),
+        -np.inf outside of the grid
+        """
+        uv = (points - self.bounds[0]) / self.cell_size
+        n_x, n_y = self.shape
+        inside = np.all((uv >= 0) & (uv <= (n_x - 1, n_y - 1)), axis=1)
+        ij = np.minimum(np.floor(uv[inside]).astype(int), (n_x - 2, n_y - 2))
+        u, v = (uv[inside] - ij).T
+        i, j = ij.T
+        values = self.values
+        clearance = np.full(points.shape[0], -np.inf)
+        clearance[inside] = (
+            (1 - u) * (1 - v) * values[i, j]
+            + u * (1 - v) * values[i + 1, j]
+            + (1 - u) * v * values[i, j + 1]
+            + u * v * values[i + 1, j + 1]
+        )
+        return clearance
+
+    def clearance_at(self, x, y):
+        """
+        scalar clearance, cheaper than clearance for a single point
+        """
+        u = (x - self._origin[0]) / self._cell_size[0]
+        v = (y - self._origin[1]) / self._cell_size[1]
+        n_x, n_y = self.shape
+        if not (0 <= u <= n_x - 1 and 0 <= v <= n_y - 1):
+            return -np.inf
+        i, j = min(int(u), n_x - 2), min(int(v), n_y - 2)
+        u, v = u - i, v - j
+        row, next_row = self._values_list[i], self._values_list[i + 1]
+        return (1 - u) * ((1 - v) * row[j] + v * row[j + 1]) + u * (
+            (1 - v) * next_row[j] + v * next_row[j + 1]
+        )
@@ -0,0 +1,182 @@
+import numpy as np
+import pinocchio as pin
+
+"""
+Vectorized SE(3) operations on stacks of homogeneous transforms of shape (..., 4, 4)
+and motions of shape (..., 6) stored as [linear, angular], following pinocchio
+conventions so that log6 matches pin.log6 transform by transform
+"""
+
+# below this angle, Taylor expansions replace the trigonometric ratios
+SMALL_ANGLE = 1e-4
+# above pi minus this angle, the rotation axis is recovered from the diagonal
+NEAR_PI = 1e-2
+# numpy overhead dominates for a few transforms, pinocchio is faster up to this size
+PIN_BATCH_SIZE = 8
+
+
+def skew(w):
+    """
+    skew symmetric matrices of shape (..., 3, 3) from vectors of shape (..., 3)
+    """
+    x, y, z = w[..., 0], w[..., 1], w[..., 2]
+    zeros = np.zeros_like(x)
+    K = np.stack((zeros, -z, y, z, zeros, -x, -y, x, zeros), axis=-1)
+    return K.reshape(w.shape[:-1] + (3, 3))
+
+
+def inverse(T):
+    """
+    analytic inverse of homogeneous transforms
+    """
+    R_inv = np.swapaxes(T[..., :3, :3], -1, -2)
+    T_inv = np.zeros_like(T)
+    T_inv[..., :3, :3] = R_inv
+    T_inv[..., :3, 3] = -(R_inv @ T[..., :3, 3, None])[..., 0]
+    T_inv[..., 3, 3] = 1
+    return T_inv
+
+
+def log3(R):
+    """
+    rotation vectors of shape (..., 3) of rotation matrices
+    """
+    return _log3(R)[0]
+
+
+def _log3(R):
+    """
+    rotation vectors of rotation matrices and their angles
+    """
+    trace = R[..., 0, 0] + R[..., 1, 1] + R[..., 2, 2]
+    cos = np.clip((trace - 1) / 2, -1, 1)
+    theta = np.arccos(cos)
+    skew_part = np.stack(
+        (
+            R[..., 2, 1] - R[..., 1, 2],
+            R[..., 0, 2] - R[..., 2, 0],
+            R[..., 1, 0] - R[..., 0, 1],
+        ),
+        axis=-1,
+    )
+    small = theta < SMALL_ANGLE
+    if small.any():
+        sin = np.where(small, 1, np.sin(theta))
+        factor = np.where(small, 0.5 + theta ** 2 / 12, theta / (2 * sin))
+    else:
+        factor = theta / (2 * np.sin(theta))
+    w = factor[..., None] * skew_part
+
+    near_pi = theta > np.pi - NEAR_PI
+    if near_pi.any():
+        # the skew part vanishes, the axis is given by the diagonal up to signs
+        R_pi, theta_pi = R[near_pi], theta[near_pi]
+        cos_pi = cos[near_pi]
+        diag = np.diagonal(R_pi, axis1=-2, axis2=-1)
+        axis = np.sqrt(np.clip((diag - cos_pi[:, None]) / (1 - cos_pi[:, None]), 0, 1))
+        # signs relative to the largest component from the symmetric part
+        k = axis.argmax(1)
+        rows = np.arange(R_pi.shape[0])
+        symmetric = R_pi[rows, :, k] + R_pi[rows, k, :]
+        symmetric[rows, k] = 1
+        axis *= np.where(symmetric < 0, -1, 1)
+        # global sign from the skew part
+        flip = (axis * skew_part[near_pi]).sum(1) < 0
+        axis[flip] *= -1
+        w[near_pi] = theta_pi[:, None] * axis
+    return w, theta
+
+
+def exp3(w):
+    """
+    rotation matrices of rotation vectors of shape (..., 3)
+    """
+    theta = np.linalg.norm(w, axis=-1)
+    small = theta < SMALL_ANGLE
+    theta_safe = np.where(small, 1, theta)
+    theta2 = theta ** 2
+    a = np.where(small, 1 - theta2 / 6, np.sin(theta) / theta_safe)
+    b = np.where(small, 0.5 - theta2 / 24, (1 - np.cos(theta)) / theta_safe ** 2)
+    K = skew(w)
+    R = a[..., None, None] * K + b[..., None, None] * (K @ K)
+    R += np.eye(3)
+    return R
+
+
+def log6(T):
+    """
+    motions of shape (..., 6) of homogeneous transforms, as pin.log6
+    """
+    if T.size <= 16 * PIN_BATCH_SIZE:
+        motions = [pin.log6(M).vector for M in T.reshape(-1, 4, 4)]
+        return np.array(motions).reshape(T.shape[:-2] + (6,))
+    p = T[..., :3, 3]
+    w, theta = _log3(T[..., :3, :3])
+    theta2 = theta ** 2
+    small = theta < SMALL_ANGLE
+    if small.any():
+        theta_safe = np.where(small, 1, theta)
+        one_m_cos = np.where(small, 1, 1 - np.cos(theta))
+        sin = np.sin(theta)
+        alpha = theta * sin / (2 * one_m_cos)
+        beta = 1 / theta_safe ** 2 - sin / (2 * theta_safe * one_m_cos)
+        alpha = np.where(small, 1 - theta2 / 12 - theta2 ** 2 / 720, alpha)
+        beta = np.where(small, 1 / 12 + theta2 / 720, beta)
+    else:
+        one_m_cos = 1 - np.cos(theta)
+        sin = np.sin(theta)
+        alpha = theta * sin / (2 * one_m_cos)
+        beta = 1 / theta2 - sin / (2 * theta * one_m_cos)
+    wx, wy, wz = w[..., 0], w[..., 1], w[..., 2]
+    px, py, pz = p[..., 0], p[..., 1], p[..., 2]
+    beta_w_dot_p = beta * (wx * px + wy * py + wz * pz)
+    motions = np.empty(T.shape[:-2] + (6,))
+    # alpha p - 1/2 w x p + beta (w . p) w
+    motions[..., 0] = alpha * px - 0.5 * (wy * pz - wz * py) + beta_w_dot_p * wx
+    motions[..., 1] = alpha * py - 0.5 * (wz * px - wx * pz) + beta_w_dot_p * wy
+    motions[..., 2] = alpha * pz - 0.5 * (wx * py - wy * px) + beta_w_dot_p * wz
+    motions[..., 3:] = w
+    return motions
+
+
+def exp6(m):
+    """
+    homogeneous transforms of motions of shape (..., 6), as pin.exp6
+    """
+    v, w = m[..., :3], m[..., 3:]
+    theta = np.linalg.norm(w, axis=-1)
+    small = theta < SMALL_ANGLE
+    theta_safe = np.where(small, 1, theta)
+    theta2 = theta ** 2
+    b = np.where(small, 0.5 - theta2 / 24, (1 - np.cos(theta)) / theta_safe ** 2)
+    c = np.where(
+        small, 1 / 6 - theta2 / 120, (theta - np.sin(theta)) / theta_safe ** 3
+    )
+    K = skew(w)
+    V = b[..., None, None] * K + c[..., None, None] * (K @ K)
+    V += np.eye(3)
+    T = np.zeros(m.shape[:-1] + (4, 4))
+    T[..., :3, :3] = exp3(w)
+    T[..., :3, 3] = np.einsum("...ij,...j->...i", V, v)
+    T[..., 3, 3] = 1
+    return T
+
+
+def difference(T0, T1):
+    """
+    motions log6(T0^-1 T1) taking T0 to T1, expressed in the frame of T0
+    """
+    if T0.size <= 16 * PIN_BATCH_SIZE and T0.shape == T1.shape:
+        motions = [
+            pin.log6(pin.SE3(M0).actInv(pin.SE3(M1))).vector
+            for M0, M1 in zip(T0.reshape(-1, 4, 4), T1.reshape(-1, 4, 4))
+        ]
+        return np.array(motions).reshape(T0.shape[:-2] + (6,))
+    return log6(inverse(T0) @ T1)
+
+
+def distance(T0, T1):
+    """
+    geodesic distance between T0 and T1, norm of their difference
+    """
+    return np.linalg.norm(difference(T0, T1), axis=-1)
@@ -0,0 +1,48 @@
+import itertools
+import numpy as np
+
+
+class SpatialHash:
+    """
+    Uniform grid hashing axis aligned boxes into the cells they overlap,
+    queries return the ids of the boxes overlapping a query box
+    """
+
+    def __init__(self, cell_size):
+        if cell_size <= 0:
+            raise ValueError("cell_size should be positive.")
+        self.cell_size = cell_size
+        self.cells = {}
+        self.lo = np.zeros((0, 3))
+        self.hi = np.zeros((0, 3))
+
+    def cell_range(self, lo, hi):
+        cell_lo = np.floor(lo / self.cell_size).astype(int)
+        cell_hi = np.floor(hi / self.cell_size).astype(int)
+        ranges = [range(a, b + 1) for a, b in zip(cell_lo, cell_hi)]
+        return itertools.product(*ranges)
+
+    def insert(self, lo, hi):
+        """
+        insert boxes given by their lower and upper corners of shape (n, 3),
+        ids are given in insertion order
+        """
+        lo, hi = np.atleast_2d(lo), np.atleast_2d(hi)
+        first_id = self.lo.shape[0]
+        for i, (box_lo, box_hi) in enumerate(zip(lo, hi)):
+            for cell in self.cell_range(box_lo, box_hi):
+                self.cells.setdefault(cell, []).append(first_id + i)
+        self.lo = np.vstack((self.lo, lo))
+        self.hi = np.vstack((self.hi, hi))
+
+    def query(self, lo, hi):
+        """
+        ids of the boxes overlapping the box [lo, hi], sorted
+        """
+        cells = self.cells
+        ids = []
+        for cell in self.cell_range(lo, hi):
+            ids.extend(cells.get(cell, ()))
+        ids = np.unique(ids).astype(int)
+        overlap = np.all((self.lo[ids] <= hi) & (self.hi[ids] >= lo), axis=1)
+        return ids[overlap]
@@ -1,8 +1,15 @@
+import os
+import itertools
 import numpy as np
 import pinocchio as pin
 import hppfcl
 import trimesh
 
+# files derived from the assets and datasets are cached out of the package
+CACHE_DIR = os.environ.get(
+    "MPENV_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "mpenv")
+)
+
 """
 Helper functions for projective geometry
 """
@@ -19,8 +26,10 @@ def from_projective(x):
 
 
 def apply_transformation(H, x):
+    if isinstance(H, pin.SE3):
+        H = H.homogeneous
     y = to_projective(x)
-    y = y.dot(H.np.T)
+    y = y.dot(H.T)
     y = from_projective(y)
     return y
 
@@ -44,13 +53,63 @@ def match_size(x, size):
 
 
 def sparse_subset(points, r):
-    result = np.array([points[0]])
-    indices = np.array([0])
-    for i, p in enumerate(points):
-        if np.min(np.linalg.norm(result - p, axis=1)) >= r:
-            result = np.vstack((result, p))
-            indices = np.hstack((indices, i))
-    return result, indices
+    """
+    greedy subset of points at least r apart, points are accepted in order,
+    returns the subset and the indices of its points.
+    Points are hashed in a grid of cell size r over their first (at most 3)
+    coordinates, pairs closer than r are searched in neighbouring cells only
+    """
+    if r <= 0:
+        raise ValueError("r should be positive.")
+    points = np.asarray(points)
+    n = points.shape[0]
+    cells = np.floor(points[:, :3] / r).astype(int)
+    # pad the grid by one cell so that neighbouring keys never wrap around
+    cells -= cells.min(axis=0) - 1
+    shape = tuple(cells.max(axis=0) + 2)
+    keys = np.ravel_multi_index(cells.T, shape)
+    order = np.argsort(keys, kind="stable")
+    cell_keys, cell_starts, cell_counts = np.unique(
+        keys[order], return_index=True, return_counts=True
+    )
+    point_cells = np.searchsorted(cell_keys, keys)
+    # half of the neighbouring cells, the other half gives the same pairs
+    neighbours = np.array(list(itertools.product((-1, 0, 1), repeat=len(shape))))
+    offsets = np.ravel_multi_index((neighbours + 1).T, shape)
+    offsets -= np.ravel_multi_index((1,) * len(shape), shape)
+    offsets = offsets[offsets >= 0]
+
+    # pairs (i, j) of points closer than r with j < i
+    pairs_i, pairs_j = [], []
+    for offset in offsets:
+        neighbour_cells = np.searchsorted(cell_keys, cell_keys + offset)
+        neighbour_cells = np.minimum(neighbour_cells, cell_keys.shape[0] - 1)
+        found = cell_keys[neighbour_cells] == cell_keys + offset
+        starts = cell_starts[neighbour_cells][point_cells]
+        counts = np.where(found, cell_counts[neighbour_cells], 0)[point_cells]
+        a = np.repeat(np.arange(n), counts)
+        ranks = np.arange(a.shape[0]) - np.repeat(np.cumsum(counts) - counts, counts)
+        b = order[np.repeat(starts, counts) + ranks]
+        if offset == 0:
+            a, b = a[b < a], b[b < a]
+        diff = points[b] - points[a]
+        close = np.sqrt((diff * diff).sum(axis=1)) < r
+        a, b = a[close], b[close]
+        pairs_i.append(np.maximum(a, b))
+        pairs_j.append(np.minimum(a, b))
+    pairs_i, pairs_j = np.concatenate(pairs_i), np.concatenate(pairs_j)
+    pairs_order = np.argsort(pairs_i, kind="stable")
+    pairs_j = pairs_j[pairs_order].tolist()
+    bounds = np.searchsorted(pairs_i[pairs_order], np.arange(n + 1)).tolist()
+
+    # a point is accepted if none of the previous points closer than r was
+    accepted = [False] * n
+    for i in range(n):
+        accepted[i] = not any(
+            accepted[j] for j in pairs_j[bounds[i] : bounds[i + 1]]
+        )
+    indices = np.flatnonzero(accepted)
+    return points[indices], indices
 
 
 """
@@ -114,6 +173,23 @@ def dict_to_geom(props):
     return geom
 
 
+def update_geom(geom, props):
+    """
+    Update in place the parameters of a primitive geometry from its dict
+    """
+    geom_name = props["name"]
+    if geom_name in ["capsule", "cylinder", "cone"]:
+        geom.radius = props["radius"]
+        geom.halfLength = props["halfLength"]
+    elif geom_name == "box":
+        geom.halfSide = props["halfSide"]
+    elif geom_name == "sphere":
+        geom.radius = props["radius"]
+    else:
+        raise ValueError(f"Unsupported geometry type for {geom_name}.")
+    geom.computeLocalAABB()
+
+
 def geom_obj_to_dict(geom_obj):
     props = {"geom": geom_to_dict(geom_obj.geometry)}
     props["name"] = geom_obj.name
@@ -149,15 +225,36 @@ def dict_to_geom_obj(props):
     return geom_obj
 
 
+def copy_geom_obj(geom_obj):
+    """
+    Copy a pin.GeometryObject without sharing its collision geometry
+    """
+    geom_obj_copy = pin.GeometryObject(
+        name=geom_obj.name,
+        parent_joint=geom_obj.parentJoint,
+        parent_frame=geom_obj.parentFrame,
+        collision_geometry=geom_obj.geometry.clone(),
+        placement=geom_obj.placement,
+        mesh_path=geom_obj.meshPath,
+        mesh_scale=geom_obj.meshScale,
+        override_material=geom_obj.overrideMaterial,
+        mesh_color=geom_obj.meshColor,
+    )
+    return geom_obj_copy
+
+
+def geometry_placement(geom_obj):
+    if hasattr(geom_obj, "q_placement"):
+        return geom_obj.q_placement.np
+    return geom_obj.placement.np
+
+
 def mesh_from_geometry(geom_obj):
     """
     Creates a mesh from a hppfcl collision geometry
     """
     geom = geom_obj.geometry
-    if hasattr(geom_obj, "q_placement"):
-        placement = geom_obj.q_placement.np
-    else:
-        placement = geom_obj.placement.np
+    placement = geometry_placement(geom_obj)
     if isinstance(geom, hppfcl.Capsule):
         mesh = trimesh.creation.capsule(radius=geom.radius, height=2 * geom.halfLength)
     elif isinstance(geom, hppfcl.Cylinder):
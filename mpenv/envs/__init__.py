@@ -187,6 +187,17 @@ for (num_room, max_idx) in zip(num_rooms, num_rooms_max_idx):
         kwargs=kwargs.copy(),
     )
 
+    # Larger images
+    for size in [128, 256]:
+        for pov, str_pov in [("global", "Global"), ("local", "Local")]:
+            str_register_env = f"Narrow{str_room}-{str_pov}Image{size}-v0"
+            kwargs = {"max_env_idx": max_idx, "size": (size, size), "pov": pov}
+            register(
+                id=str_register_env,
+                entry_point="mpenv.envs.narrow:narrow_image",
+                kwargs=kwargs.copy(),
+            )
+
 """
 Maze 2D environments
 """
@@ -218,11 +229,22 @@ register(
     entry_point="mpenv.envs.maze:maze_edges",
     kwargs={"grid_size": 7},
 )
+# mazes picked from the bank generated by python -m mpenv.envs.maze_bank --grid-size 5
+register(
+    id=f"Maze-Medium-Bank-v0",
+    entry_point="mpenv.envs.maze:maze_edges",
+    kwargs={"grid_size": 5, "maze_bank": True},
+)
 register(
     id=f"Maze-Medium-DistanceCurriculum-v0",
     entry_point="mpenv.envs.maze:maze_edges_distance_curriculum",
     kwargs={"grid_size": 5},
 )
+register(
+    id=f"Maze-Medium-GeodesicCurriculum-v0",
+    entry_point="mpenv.envs.maze:maze_edges_distance_curriculum",
+    kwargs={"grid_size": 5, "geodesic": True},
+)
 register(
     id=f"Maze-Medium-ObstaclesCurriculum-v0",
     entry_point="mpenv.envs.maze:maze_edges_obstacles_curriculum",
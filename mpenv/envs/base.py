@@ -1,3 +1,4 @@
+import math
 import time
 import os
 import numpy as np
@@ -11,6 +12,11 @@ from gym.utils import seeding
 
 from mpenv.core.model import ModelWrapper
 from mpenv.core.model import ConfigurationWrapper
+from mpenv.core import boxes2d
+from mpenv.core import se3
+from mpenv.core.sdf import SDF2D
+from mpenv.core import utils as core_utils
+from mpenv.core.geometry import UNION_CACHE_DIR
 
 from mpenv.envs import utils
 from mpenv.core.visualizer import Visualizer
@@ -26,6 +32,28 @@ class Base(gym.Env):
     def __init__(self, robot_name):
         self.seed()
         self.delta_collision_check = 1e-2
+        # check motions with conservative advancement instead of sampling them
+        self.continuous_collision = False
+        # planar environments made of axis aligned boxes can replace
+        # pinocchio continuous collision checks with analytic ones
+        self.analytic_collision = False
+        self.boxes2d = None
+        # keep the collision model across episodes, only update the obstacles,
+        # for environments with a fixed number of obstacles
+        self.incremental_reset = False
+        # only check the obstacles close to the robot, for scenes with many obstacles
+        self.broadphase = False
+        # planar environments can build a signed distance field of their boxes
+        # each episode, motions within the clearance of the robot skip collision checks
+        self.sdf_resolution = None
+        self.sdf = None
+        # union meshes of the obstacles are cached on disk there, None disables
+        # the cache, and in lazy mode only computed when read
+        self.union_cache_dir = UNION_CACHE_DIR
+        self.lazy_union = False
+        # geometry ids and collision pairs ids of each obstacle slot
+        self.obstacle_ids = []
+        self.obstacle_pairs = []
 
         self.model = None
         # gepetto, panda3d, meshcat
@@ -34,6 +62,10 @@ class Base(gym.Env):
         self.o3d_viz = Open3DVisualizer()
         self.state = None
         self.goal_state = None
+        self.geoms = None
+        # worlds of the last dataset loaded, environments supporting it pick the
+        # worlds of their episodes from it
+        self.dataset = None
         self.cartesian_integration = False
         self._seed = None
         self.config_dim = 0
@@ -59,6 +91,14 @@ class Base(gym.Env):
         # useful to recover structured data in a model
         self.obs_shape = 0
         self.obs_indices = {}
+        # observers write in place into one buffer laid out by obs_indices, of the
+        # dtype of the observation space. With copy_observation a new buffer is
+        # returned at each observation, otherwise the same buffer is overwritten by
+        # the next observation. Copying is the default as rollouts such as rlkit
+        # multitask_rollout keep the observations of a path, which would all alias
+        # the last one, callers consuming each observation at once can disable it
+        self.copy_observation = True
+        self.obs_buffer = None
         self.observation_space = Dict(
             {
                 "observation": spaces.Box(
@@ -112,10 +152,67 @@ class Base(gym.Env):
         robot_n_joints = self.robot_n_joints
         check_collision = range(robot_n_joints)
         n_geom_model = len(geom_model.geometryObjects)
+        pairs = []
         for collision_id in check_collision:
+            pairs.append(len(geom_model.collisionPairs))
             geom_model.addCollisionPair(
                 pin.CollisionPair(collision_id, n_geom_model - 1)
             )
+        self.obstacle_ids.append(n_geom_model - 1)
+        self.obstacle_pairs.append(pairs)
+
+    def build_world(self, robot_name, bounds, geom_objs):
+        """
+        Add the robot and the obstacles to the collision model and create its data.
+        With incremental_reset, the collision model of the previous episode is kept
+        whenever the obstacles match its slots, only the obstacles geometries
+        and placements are then updated in place
+        """
+        if self.incremental_reset:
+            if self.update_obstacles(geom_objs):
+                return
+            self.model_wrapper = ModelWrapper()
+        self.obstacle_ids = []
+        self.obstacle_pairs = []
+        self.robot = self.add_robot(robot_name, bounds)
+        for geom_obj in geom_objs:
+            if self.incremental_reset:
+                # slots geometries are updated in place, do not share them
+                geom_obj = core_utils.copy_geom_obj(geom_obj)
+            self.add_obstacle(geom_obj, static=True)
+        self.model_wrapper.create_data()
+        if self.broadphase:
+            self.model_wrapper.enable_broadphase()
+
+    def update_obstacles(self, geom_objs):
+        """
+        Update in place the obstacles slots of the collision model with geom_objs.
+        Returns False if geom_objs do not match the slots one to one, the world is
+        then rebuilt so that no stale obstacle stays in the model
+        """
+        model_wrapper = self.model_wrapper
+        geom_model = model_wrapper.geom_model
+        geom_data = model_wrapper.geom_data
+        if geom_data is None or len(geom_objs) != len(self.obstacle_ids):
+            return False
+        props = []
+        for geom_obj, geom_id in zip(geom_objs, self.obstacle_ids):
+            props_geom = core_utils.geom_to_dict(geom_obj.geometry)
+            slot_geom = geom_model.geometryObjects[geom_id].geometry
+            slot_name = core_utils.geom_to_dict(slot_geom)["name"]
+            if props_geom["name"] != slot_name or slot_name == "mesh":
+                return False
+            props.append(props_geom)
+
+        # the broad-phase is built from the slots placements
+        model_wrapper.disable_broadphase()
+        for geom_obj, geom_id, props_geom in zip(geom_objs, self.obstacle_ids, props):
+            slot = geom_model.geometryObjects[geom_id]
+            core_utils.update_geom(slot.geometry, props_geom)
+            slot.placement = geom_obj.placement
+        if self.broadphase:
+            model_wrapper.enable_broadphase()
+        return True
 
     def set_state(self, qw):
         if isinstance(qw, np.ndarray):
@@ -146,7 +243,8 @@ class Base(gym.Env):
         return [seed]
 
     def reset(self, **kwargs):
-        self.model_wrapper = ModelWrapper()
+        if not self.incremental_reset:
+            self.model_wrapper = ModelWrapper()
         if not (self.viz is None):
             del self.viz
         self.viz = None
@@ -159,33 +257,160 @@ class Base(gym.Env):
     def load_dataset(self, dataset_path):
         if not os.path.exists(dataset_path):
             raise ValueError(f"No dataset found: {dataset_path}")
-        dataset_geoms = utils.load_dataset_geoms(dataset_path)
+        dataset_geoms = utils.load_dataset_geoms(
+            dataset_path, self.union_cache_dir, self.lazy_union
+        )
+        self.dataset = dataset_geoms
         return dataset_geoms
 
+    def stored_surface_pcd(self, n_pts):
+        """
+        n_pts points and normals sampled on the obstacles surface stored with the
+        current world, as the worlds of a columnar dataset, None if not stored
+        """
+        if self.geoms is None or self.geoms.surface_pcd is None:
+            return None
+        points, normals = self.geoms.surface_pcd
+        if points.shape[0] < n_pts:
+            return None
+        if normals is not None:
+            normals = normals[:n_pts]
+        return points[:n_pts], normals
+
+    def motion_path(self, state, next_state):
+        """
+        Path to check for collisions when moving from state to next_state,
+        the motion end points in continuous collision mode,
+        configurations spaced by delta_collision_check otherwise
+        """
+        if self.continuous_collision:
+            return np.stack((state.q, next_state.q))
+        return self.model_wrapper.arange_q(
+            state, next_state, self.delta_collision_check
+        )
+
     def stopping_configuration(self, path):
         """
         Assumes path[0] is always a collision free configuration
         Returns the latest configuration of path which is collision free
+        path is either a list of ConfigurationWrapper or an array of shape (N, nq)
+        In continuous collision mode, the path is followed up to the first contact
         """
         model_wrapper = self.model_wrapper
-        new_state = path[0]
-        collision_labels = np.zeros_like(model_wrapper.collision_labels())
-        for state in path[1:]:
-            collide = model_wrapper.collision(state)
+        if not isinstance(path, np.ndarray):
+            path = np.array([qw.q for qw in path])
+        if self.sdf is not None and self.sdf_motion_free(path):
+            collision_labels = model_wrapper.empty_collision_labels()
+            return ConfigurationWrapper(model_wrapper, path[-1].copy()), collision_labels
+        if self.continuous_collision:
+            return self.continuous_stopping_configuration(path)
+        _, first_idx = model_wrapper.collision_batch(path[1:], stop_at_first=True)
+        if first_idx is None:
+            collision_labels = model_wrapper.empty_collision_labels()
+            new_q = path[-1]
+        else:
+            # path[first_idx + 1] is the first configuration in collision
             collision_labels = model_wrapper.collision_labels()
-            if not collide:
-                new_state = state
-            else:
-                return new_state, collision_labels
+            new_q = path[first_idx]
+        new_state = ConfigurationWrapper(model_wrapper, new_q.copy())
         return new_state, collision_labels
 
+    def continuous_stopping_configuration(self, path):
+        model_wrapper = self.model_wrapper
+        for q0, q1 in zip(path[:-1], path[1:]):
+            if self.analytic_collision:
+                t, collision_labels = self.analytic_continuous_collision(q0, q1)
+            else:
+                t, collision_labels = model_wrapper.continuous_collision(q0, q1)
+            if t is not None:
+                new_q = pin.interpolate(model_wrapper.model, q0, q1, t)
+                return ConfigurationWrapper(model_wrapper, new_q), collision_labels
+        collision_labels = model_wrapper.empty_collision_labels()
+        return ConfigurationWrapper(model_wrapper, path[-1].copy()), collision_labels
+
+    def path_collides(self, path):
+        """
+        Same check as stopping_configuration for callers which only need to know
+        whether the path collides, neither the stopping configuration nor the
+        collision labels are computed
+        """
+        model_wrapper = self.model_wrapper
+        if not isinstance(path, np.ndarray):
+            path = np.array([qw.q for qw in path])
+        if self.sdf is not None and self.sdf_motion_free(path):
+            return False
+        if self.continuous_collision:
+            for q0, q1 in zip(path[:-1], path[1:]):
+                if self.analytic_collision:
+                    t, _ = self.analytic_continuous_collision(q0, q1)
+                else:
+                    t, _ = model_wrapper.continuous_collision(q0, q1)
+                if t is not None:
+                    return True
+            return False
+        _, first_idx = model_wrapper.collision_batch(path[1:], stop_at_first=True)
+        return first_idx is not None
+
+    def analytic_continuous_collision(self, q0, q1):
+        """
+        Same as ModelWrapper.continuous_collision for a sphere moving in the plane
+        among the axis aligned boxes2d obstacles
+        """
+        radius = self.robot.mesh.geometry.radius
+        t, boxes_labels = boxes2d.first_contact(q0[:2], q1[:2], self.boxes2d, radius)
+        collision_labels = self.model_wrapper.empty_collision_labels()
+        if t is not None:
+            # first pair semantics of ModelWrapper.collision_labels
+            box = np.argmax(boxes_labels)
+            geom_model = self.model_wrapper.geom_model
+            pair = geom_model.collisionPairs[self.obstacle_pairs[box][0]]
+            collision_labels[pair.first] = True
+            collision_labels[pair.second] = True
+        return t, collision_labels
+
+    def compute_sdf(self):
+        """
+        signed distance field of the planar boxes of the episode
+        """
+        bounds = self.freeflyer_bounds[:, :2]
+        return SDF2D.from_boxes(self.boxes2d, bounds, self.sdf_resolution)
+
+    def compute_occupancy_grid(self, size, supersampling=1):
+        """
+        occupancy grid of the robot over the planar boxes of the episode,
+        rasterized instead of checking the collisions at the cell centers
+        """
+        radius = self.robot.mesh.geometry.radius
+        return boxes2d.occupancy_grid(self.boxes2d, size, radius, supersampling)
+
+    def clearance(self, state):
+        """
+        distance between the robot and the obstacles looked up in the SDF,
+        negative in collision, up to sdf.max_error
+        """
+        q = state.q
+        radius = self.robot.mesh.geometry.radius
+        return self.sdf.clearance_at(q[0], q[1]) - radius
+
+    def sdf_motion_free(self, path):
+        """
+        True if the straight motion from path[0] to path[-1], as given by motion_path,
+        stays within the clearance of path[0] and is thus collision free.
+        False when the SDF cannot tell
+        """
+        x0, y0 = path[0, :2].tolist()
+        x1, y1 = path[-1, :2].tolist()
+        radius = self.robot.mesh.geometry.radius
+        safe_distance = self.sdf.clearance_at(x0, y0) - radius - self.sdf.max_error
+        return math.hypot(x1 - x0, y1 - y0) < safe_distance
+
     def move(self, state, velocity):
         model_wrapper = self.model_wrapper
         # velocity = self.entities.lift_speed(velocity)
         next_state = model_wrapper.integrate(
             state, velocity, self.cartesian_integration
         )
-        path = model_wrapper.arange(state, next_state, self.delta_collision_check)
+        path = self.motion_path(state, next_state)
         next_state_free, collision_labels = self.stopping_configuration(path)
         return next_state_free, collision_labels
 
@@ -246,14 +471,7 @@ class Base(gym.Env):
         # links defined goal
         achieved_goal = achieved_goal.reshape(-1, n_joints, 4, 4)
         goal = goal.reshape(-1, n_joints, 4, 4)
-        diff = np.linalg.inv(achieved_goal) @ goal
-        motions = np.zeros((diff.shape[0], n_joints, 6))
-        for i, d in enumerate(diff):
-            for j, dj, in enumerate(d):
-                m = pin.log6(dj)
-                motions[i, j, :3] = m.linear
-                motions[i, j, 3:] = m.angular
-        dist_goal = np.linalg.norm(motions, axis=2)
+        dist_goal = se3.distance(achieved_goal, goal)
         near_goal = (dist_goal < dist_goal_success).all(1, keepdims=True)
         success = np.logical_and(near_goal, ~collided.any(1, keepdims=True))
         done = success
@@ -327,7 +545,15 @@ class Base(gym.Env):
         return self.observe()
 
     def observe(self):
-        return {"observation": np.zeros(0)}
+        box = self.observation_space["observation"]
+        if (
+            self.copy_observation
+            or self.obs_buffer is None
+            or self.obs_buffer.shape != box.shape
+            or self.obs_buffer.dtype != box.dtype
+        ):
+            self.obs_buffer = np.zeros(box.shape, dtype=box.dtype)
+        return {"observation": self.obs_buffer}
 
     def normalize(self, x, coordinate_frame):
         if coordinate_frame == "local":
@@ -63,11 +63,7 @@ class Boxes(Base):
 
     def _reset(self, start=None, goal=None):
         self.geoms = self.get_obstacles_geoms()
-        self.robot = self.add_robot(self.robot_name, self.freeflyer_bounds)
-
-        for geom_obj in self.geoms.geom_objs:
-            self.add_obstacle(geom_obj, static=True)
-        self.model_wrapper.create_data()
+        self.build_world(self.robot_name, self.freeflyer_bounds, self.geoms.geom_objs)
 
         if start is not None:
             if not isinstance(start, ConfigurationWrapper):
@@ -86,7 +82,9 @@ class Boxes(Base):
 
     def get_obstacles_geoms(self):
         if not self.has_boxes:
-            return Geometries()
+            return Geometries([], self.union_cache_dir, self.lazy_union)
+        if self.dataset is not None:
+            return self.dataset[self._np_random.randint(len(self.dataset))]
 
         # boxes
         if self.n_obstacles is None:
@@ -107,7 +105,7 @@ class Boxes(Base):
             self.obstacles_alpha,
         )
         self.se3_obst_tuple = placement_tuple
-        geoms = Geometries(geom_objs)
+        geoms = Geometries(geom_objs, self.union_cache_dir, self.lazy_union)
         return geoms
 
     def compute_surface_pcd(self, n_pts):
@@ -224,11 +222,13 @@ def boxes_pointcloud(robot_name, n_samples, on_surface, add_normals):
     return env
 
 
-def boxes_raytracing(robot_name, n_samples, n_rays):
+def boxes_raytracing(robot_name, n_samples, n_rays, persistent_map=False):
     env = Boxes(robot_name, has_boxes=True, cube_bounds=True, dynamic_obstacles=False)
     visibility_radius = 0.7
     memory_distance = 0.06
-    env = RayTracingObserver(env, n_samples, n_rays, visibility_radius, memory_distance)
+    env = RayTracingObserver(
+        env, n_samples, n_rays, visibility_radius, memory_distance, persistent_map
+    )
     coordinate_frame = "local"
     env = RobotLinksObserver(env, coordinate_frame)
     return env
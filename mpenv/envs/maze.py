@@ -1,5 +1,6 @@
 import os
 import numpy as np
+from collections import OrderedDict
 from gym import spaces
 import hppfcl
 import pinocchio as pin
@@ -10,21 +11,32 @@ import matplotlib.collections as collections
 from mpenv.core.mesh import Mesh
 from mpenv.envs.base import Base
 from mpenv.envs.maze_generator import Maze
+from mpenv.envs.maze_bank import load_maze_bank, maze_bank_filename, geometry_walls
+from mpenv.envs.maze_bank import cell_graph, cell_distances
 from mpenv.envs import utils as envs_utils
 from mpenv.envs.utils import ROBOTS_PROPS
 from mpenv.core import utils
+from mpenv.core import boxes2d
 from mpenv.core.geometry import Geometries
+from mpenv.core.model import ConfigurationWrapper
 
 from mpenv.observers.robot_links import RobotLinksObserver
 from mpenv.observers.point_cloud import PointCloudObserver
 from mpenv.observers.ray_tracing import RayTracingObserver
+from mpenv.observers.image import ImageObserver
 from mpenv.observers.maze import MazeObserver
 
 
 class MazeGoal(Base):
-    def __init__(self, grid_size):
+    def __init__(
+        self, grid_size, analytic_collision=False, sdf_resolution=None, maze_bank=None
+    ):
         super().__init__(robot_name="sphere")
 
+        self.analytic_collision = analytic_collision
+        self.continuous_collision = analytic_collision
+        self.sdf_resolution = sdf_resolution
+
         self.thickness = 0.02
         self.grid_size = grid_size
         self.robot_name = "sphere"
@@ -35,22 +47,39 @@ class MazeGoal(Base):
         self.action_space = spaces.Box(
             low=-1, high=1, shape=(self.robot_props["action_dim"],), dtype=np.float32
         )
+        self.normalizer_local = {"mean": 0.0, "std": 0.3}
+        self.normalizer_global = {"mean": 0.5, "std": 0.5}
+
+        # mazes are picked from a precomputed bank file instead of generated,
+        # True picks the default bank of the grid size
+        self.maze_bank = None
+        if maze_bank is True:
+            maze_bank = maze_bank_filename(grid_size)
+        if maze_bank is not None:
+            self.maze_bank = load_maze_bank(maze_bank)
+            if self.maze_bank.grid_size != grid_size:
+                raise ValueError(
+                    f"The maze bank has a grid size of {self.maze_bank.grid_size}"
+                    f" instead of {grid_size}."
+                )
+        # geometries and collision models of the last bank mazes used, by index,
+        # least recently used first
+        self.bank_worlds = OrderedDict()
+        self.bank_cache_size = 16
+        self.data_split = "train"
 
         self.fig, self.ax, self.pos = None, None, None
 
     def _reset(self, idx_env=None, start=None, goal=None):
-        model_wrapper = self.model_wrapper
-        self.robot = self.add_robot("sphere2d", self.freeflyer_bounds)
         self.geoms, self.idx_env = self.get_obstacles_geoms(idx_env)
-        for geom_obj in self.geoms.geom_objs:
-            self.add_obstacle(geom_obj, static=True)
-        model_wrapper.create_data()
-
-        valid_sample = False
-        while not valid_sample:
-            self.state = self.random_configuration()
-            self.goal_state = self.random_configuration()
-            valid_sample = self.validate_sample(self.state, self.goal_state)
+        # the worlds of bank mazes are built with their geometries and cached
+        if self.maze_bank is None:
+            self.build_world("sphere2d", self.freeflyer_bounds, self.geoms.geom_objs)
+        self.boxes2d = boxes2d.from_geom_objs(self.geoms.geom_objs)
+        if self.sdf_resolution is not None:
+            self.sdf = self.compute_sdf()
+
+        self.state, self.goal_state = self.sample_start_goal()
         if start is not None:
             self.set_state(start)
         if goal is not None:
@@ -62,24 +91,99 @@ class MazeGoal(Base):
 
         return self.observation()
 
+    def sample_start_goal(self):
+        valid_sample = False
+        while not valid_sample:
+            state = self.random_configuration()
+            goal_state = self.random_configuration()
+            valid_sample = self.validate_sample(state, goal_state)
+        return state, goal_state
+
     def validate_sample(self, state, goal_state):
         "Filter start and goal with straight path solution"
-        straight_path = self.model_wrapper.arange(
-            state, goal_state, self.delta_collision_check
+        straight_path = self.motion_path(state, goal_state)
+        return self.path_collides(straight_path)
+
+    def maze_distances(self):
+        """
+        geodesic distances in cells between all the cells of the current maze and
+        the diameter of the maze
+        """
+        if self.maze_bank is not None:
+            idx = self.idx_env
+            return self.maze_bank.distances[idx], self.maze_bank.diameters[idx]
+        south, east = geometry_walls(self.maze.south, self.maze.east)
+        distances = cell_distances(cell_graph(south, east))
+        return distances, distances.max()
+
+    def cell_configuration(self, cell, n_candidates=16):
+        """
+        free configuration sampled in a cell, away from the walls on its sides. The
+        walls ending at the corners of open sides are avoided by keeping the first
+        free candidate, or by staying away from all the sides when none is free
+        """
+        x, y = divmod(cell, self.grid_size)
+        south, east = geometry_walls(self.maze.south, self.maze.east)
+        radius = self.robot.mesh.geometry.radius
+        margin = self.thickness / 2 + radius
+        low = np.array([x, y]) / self.grid_size
+        high = low + 1 / self.grid_size
+        if np.any(low + margin >= high - margin):
+            raise ValueError("The cells are too small to hold the robot.")
+        low_walls = np.array([x == 0 or east[x - 1, y], y == 0 or south[x, y - 1]])
+        high_walls = np.array([east[x, y], south[x, y]])
+        candidates = self._np_random.uniform(
+            low + margin * low_walls, high - margin * high_walls, (n_candidates, 2)
         )
-        _, collide = self.stopping_configuration(straight_path)
-        return collide.any()
+        clearance = boxes2d.points_distance(candidates, self.boxes2d).min(axis=1)
+        free = np.flatnonzero(clearance > radius)
+        q = self.freeflyer_bounds[0].copy()
+        if free.shape[0] > 0:
+            q[:2] = candidates[free[0]]
+        else:
+            q[:2] = self._np_random.uniform(low + margin, high - margin)
+        return ConfigurationWrapper(self.model_wrapper, q)
 
     def get_obstacles_geoms(self, idx_env):
         np_random = self._np_random
-        self.maze = Maze(self.grid_size, self.grid_size)
+        if self.maze_bank is not None:
+            return self.get_bank_geoms(idx_env)
+        self.maze = Maze(self.grid_size, self.grid_size, np_random=np_random)
         self.maze.make_maze()
-        geom_objs = extract_obstacles(self.maze, self.thickness)
-        geoms = Geometries(geom_objs)
+        self.edges = extract_edges(self.maze)
+        geom_objs = extract_obstacles(self.edges, self.thickness)
+        geoms = Geometries(geom_objs, self.union_cache_dir, self.lazy_union)
+        return geoms, idx_env
+
+    def get_bank_geoms(self, idx_env):
+        """
+        maze idx_env of the bank, sampled in the current split if None, with its
+        walls merged into boxes. The edges observed are the walls of each cell as
+        for generated mazes, so that the observations do not depend on the bank.
+        The collision model is only built when the maze is not cached
+        """
+        if idx_env is None:
+            idx_env = self.maze_bank.sample_index(self._np_random, self.data_split)
+        self.maze = self.maze_bank.maze(idx_env)
+        self.edges = extract_edges(self.maze)
+        if idx_env in self.bank_worlds:
+            self.bank_worlds.move_to_end(idx_env)
+            geoms, world = self.bank_worlds[idx_env]
+            self.model_wrapper, self.robot = world[:2]
+            self.obstacle_ids, self.obstacle_pairs = world[2:]
+            return geoms, idx_env
+        segments = self.maze_bank.maze_segments(idx_env)
+        geom_objs = extract_obstacles(segments, self.thickness)
+        geoms = Geometries(geom_objs, self.union_cache_dir, self.lazy_union)
+        self.build_world("sphere2d", self.freeflyer_bounds, geoms.geom_objs)
+        world = (self.model_wrapper, self.robot, self.obstacle_ids, self.obstacle_pairs)
+        self.bank_worlds[idx_env] = (geoms, world)
+        if len(self.bank_worlds) > self.bank_cache_size:
+            self.bank_worlds.popitem(last=False)
         return geoms, idx_env
 
     def set_eval(self):
-        pass
+        self.data_split = "eval"
 
     def render(self, *unused_args, **unused_kwargs):
         if self.fig is None:
@@ -140,32 +244,68 @@ class MazeGoal(Base):
 
 
 class MazeGoalDistanceCurriculum(MazeGoal):
+    def __init__(
+        self,
+        grid_size,
+        analytic_collision=False,
+        sdf_resolution=None,
+        maze_bank=None,
+        geodesic=False,
+    ):
+        super().__init__(grid_size, analytic_collision, sdf_resolution, maze_bank)
+        # sample start and goal cells in a band of geodesic distance instead of
+        # rejecting configurations out of a band of euclidean distance
+        self.geodesic = geodesic
+        self.geodesic_distance = None
+        # x and y of the cells, indexed by x * grid_size + y
+        self.cell_coordinates = np.divmod(np.arange(grid_size * grid_size), grid_size)
+
     def _reset(self, idx_env=None, start=None, goal=None, curriculum_difficulty=1.0):
         self.difficulty = curriculum_difficulty
-        self.MAX_PATH_LENGTH = max(self.difficulty * np.sqrt(2), 0.2)
-        self.MIN_PATH_LENGTH = max(self.difficulty / 2.0, 0.0) * np.sqrt(2)
         kwargs = {"idx_env": idx_env, "start": start, "goal": goal}
         return super(MazeGoalDistanceCurriculum, self)._reset(**kwargs)
 
-    def validate_sample(self, state, goal_state):
-        "Filter start and goal with straight path solution"
-        """
-        success, path, _, _ = Base.solve_rrt(self, simplify=True, max_iterations=2000)
-
-        if success:
-            path_length = 0
+    def sample_start_goal(self):
+        if not self.geodesic:
+            self.MAX_PATH_LENGTH = max(self.difficulty * np.sqrt(2), 0.2)
+            self.MIN_PATH_LENGTH = max(self.difficulty / 2.0, 0.0) * np.sqrt(2)
+            return super().sample_start_goal()
+        distances, diameter = self.maze_distances()
+        difficulty = np.clip(self.difficulty, 0.0, 1.0)
+        # the goal is never sampled in the start cell
+        min_distance = max(int(np.floor(difficulty / 2 * diameter)), 1)
+        max_distance = max(int(np.ceil(difficulty * diameter)), 1)
+
+        # Every cell is at least half the diameter away from some cell and the
+        # distances from a cell take all the values up to that one, so any start
+        # cell has goal cells in the band and only its row is filtered.
+        # Allow straight path solutions for the easiest levels of difficulty.
+        # A pair of cells further apart than their manhattan distance is not
+        # connected by a straight path, start cells are tried in random order
+        # until one has such goal cells in the band.
+        cells_x, cells_y = self.cell_coordinates
+        first = None
+        for start_cell in self._np_random.permutation(distances.shape[0]):
+            row = distances[start_cell]
+            band = (row >= min_distance) & (row <= max_distance)
+            if self.difficulty <= 0.25:
+                break
+            x, y = divmod(start_cell, self.grid_size)
+            detour = band & (row > np.abs(cells_x - x) + np.abs(cells_y - y))
+            if detour.any():
+                band = detour
+                break
+            if first is None:
+                first = start_cell, row, band
+        else:
+            start_cell, row, band = first
 
-            start = path["points"][0].q[:2]
-            for point in path["points"][1:]:
-                end = point.q[:2]
-                path_length += np.sqrt(np.sum(np.power(start - end, 2.0)))
-                start = end
+        goal_cell = self._np_random.choice(np.flatnonzero(band))
+        self.geodesic_distance = row[goal_cell]
+        return self.cell_configuration(start_cell), self.cell_configuration(goal_cell)
 
-            if path_length > self.MAX_PATH_LENGTH:
-                print("Rejected environment because path length was too big:")
-                print("\t{} > {}".format(path_length, min(self.difficulty + 0.25, 1.0) * self.MAX_PATH_LENGTH))
-                return False
-        """
+    def validate_sample(self, state, goal_state):
+        "Filter start and goal with straight path solution"
         path_length = np.sqrt(np.sum(np.power(state.q[:2] - goal_state.q[:2], 2.0)))
 
         if path_length > self.MAX_PATH_LENGTH or path_length < self.MIN_PATH_LENGTH:
@@ -173,17 +313,17 @@ class MazeGoalDistanceCurriculum(MazeGoal):
 
         # Allow straight path solutions for the easiest levels of difficulty.
         if self.difficulty > 0.25:
-            straight_path = self.model_wrapper.arange(
-                state, goal_state, self.delta_collision_check
-            )
-
-            _, collide = self.stopping_configuration(straight_path)
-            return collide.any()
+            straight_path = self.motion_path(state, goal_state)
+            return self.path_collides(straight_path)
         else:
             return True
 
 
 class MazeGoalObstaclesCurriculum(MazeGoal):
+    def __init__(self, grid_size, analytic_collision=False, sdf_resolution=None):
+        # obstacles are truncated from generated mazes, merged bank walls are not
+        super().__init__(grid_size, analytic_collision, sdf_resolution)
+
     def _reset(self, idx_env=None, start=None, goal=None, curriculum_difficulty=1.0):
         self.difficulty = curriculum_difficulty
         self.HARD_MAX_OBSTACLES = self.grid_size ** 2.0
@@ -197,72 +337,58 @@ class MazeGoalObstaclesCurriculum(MazeGoal):
         if self.difficulty < 0.25:
             return True
 
-        straight_path = self.model_wrapper.arange(
-            state, goal_state, self.delta_collision_check
-        )
-
-        _, collide = self.stopping_configuration(straight_path)
-        return collide.any()
+        straight_path = self.motion_path(state, goal_state)
+        return self.path_collides(straight_path)
 
     def get_obstacles_geoms(self, idx_env):
         np_random = self._np_random
-        self.maze = Maze(self.grid_size, self.grid_size)
+        self.maze = Maze(self.grid_size, self.grid_size, np_random=np_random)
         self.maze.make_maze()
-        geom_objs = extract_obstacles(self.maze, self.thickness)
-        geoms = Geometries(geom_objs)
+        self.edges = extract_edges(self.maze)
+        geom_objs = extract_obstacles(self.edges, self.thickness)
+        geoms = Geometries(geom_objs, self.union_cache_dir, self.lazy_union)
 
         # Truncating obstacles to maximum depending on the curriculum difficulty.
         # We need to keep the at least (4 * grid_size) walls surrounding the whole maze.
         geoms.geom_objs = geoms.geom_objs[:4 * self.grid_size + self.MAX_OBSTACLES]
+        self.edges = self.edges[: len(geoms.geom_objs)]
         return geoms, idx_env
 
 
-def extract_obstacles(maze, thickness):
-    scx = 1 / maze.nx
-    scy = 1 / maze.ny
-
-    obstacles_coord = []
-    # Draw top and left walls.
-    for x in range(maze.nx):
-        obstacles_coord.append((x / maze.nx, 0, (x + 1) / maze.nx, 0))
-    for y in range(maze.ny):
-        obstacles_coord.append((0, y / maze.ny, 0, (y + 1) / maze.ny))
-
-    # Draw right and bottom walls.
-    for x in range(maze.nx):
-        obstacles_coord.append((x / maze.nx, 1.0, (x + 1) / maze.nx, 1.0))
-    for y in range(maze.ny):
-        obstacles_coord.append((1.0, y / maze.ny, 1.0, (y + 1) / maze.ny))
+def extract_edges(maze):
+    """
+    walls of the maze as an array of shape (n_walls, 4) of segments x1, y1, x2, y2,
+    the borders followed by the South and East walls of the cells
+    """
+    nx, ny = maze.nx, maze.ny
+    scx, scy = 1 / nx, 1 / ny
+    x, y = np.arange(nx), np.arange(ny)
+    zeros_x, zeros_y = np.zeros(nx), np.zeros(ny)
+    # top and left walls then right and bottom walls
+    borders = [
+        np.stack((x / nx, zeros_x, (x + 1) / nx, zeros_x), axis=1),
+        np.stack((zeros_y, y / ny, zeros_y, (y + 1) / ny), axis=1),
+        np.stack((x / nx, zeros_x + 1.0, (x + 1) / nx, zeros_x + 1.0), axis=1),
+        np.stack((zeros_y + 1.0, y / ny, zeros_y + 1.0, (y + 1) / ny), axis=1),
+    ]
 
     # Draw the "South" and "East" walls of each cell, if present (these
     # are the "North" and "West" walls of a neighbouring cell in
     # general, of course).
     # We ignore last row & last column of cells since the right & bottom walls have already been drawn.
-    for x in range(maze.nx - 1):
-        for y in range(maze.ny - 1):
-            if maze.cell_at(x, y).walls["S"]:
-                x1, y1, x2, y2 = (
-                    x * scx,
-                    (y + 1) * scy,
-                    (x + 1) * scx,
-                    (y + 1) * scy,
-                )
-                obstacles_coord.append((x1, y1, x2, y2))
-            if maze.cell_at(x, y).walls["E"]:
-                x1, y1, x2, y2 = (
-                    (x + 1) * scx,
-                    y * scy,
-                    (x + 1) * scx,
-                    (y + 1) * scy,
-                )
-                obstacles_coord.append((x1, y1, x2, y2))
+    x, y = np.meshgrid(x[:-1], y[:-1], indexing="ij")
+    inner = np.empty((nx - 1, ny - 1, 2, 4))
+    inner[:, :, 0] = np.stack((x * scx, (y + 1) * scy, (x + 1) * scx, (y + 1) * scy), 2)
+    inner[:, :, 1] = np.stack(((x + 1) * scx, y * scy, (x + 1) * scx, (y + 1) * scy), 2)
+    south, east = maze.wall_bitmaps()
+    walls = np.stack((south[:-1, :-1], east[:-1, :-1]), axis=2)
+    return np.vstack(borders + [inner[walls]])
+
+
+def extract_obstacles(edges, thickness):
+    corners = edges + np.array([-1, -1, 1, 1]) * thickness / 2
     obstacles = []
-    for i, obst_coord in enumerate(obstacles_coord):
-        x1, y1, x2, y2 = obst_coord[0], obst_coord[1], obst_coord[2], obst_coord[3]
-        x1 -= thickness / 2
-        x2 += thickness / 2
-        y1 -= thickness / 2
-        y2 += thickness / 2
+    for i, (x1, y1, x2, y2) in enumerate(corners):
         box_size = [x2 - x1, y2 - y1, 0.1]
         pos = [(x1 + x2) / 2, (y1 + y2) / 2, 0]
         placement = pin.SE3(np.eye(3), np.array(pos))
@@ -277,35 +403,51 @@ def extract_obstacles(maze, thickness):
     return obstacles
 
 
-def maze_edges(grid_size):
-    env = MazeGoal(grid_size)
+def maze_edges(grid_size, analytic_collision=False, maze_bank=None):
+    env = MazeGoal(grid_size, analytic_collision, maze_bank=maze_bank)
     env = MazeObserver(env)
     coordinate_frame = "local"
     env = RobotLinksObserver(env, coordinate_frame)
     return env
 
 
-def maze_edges_distance_curriculum(grid_size):
-    env = MazeGoalDistanceCurriculum(grid_size)
+def maze_edges_distance_curriculum(
+    grid_size, analytic_collision=False, maze_bank=None, geodesic=False
+):
+    env = MazeGoalDistanceCurriculum(
+        grid_size, analytic_collision, maze_bank=maze_bank, geodesic=geodesic
+    )
     env = MazeObserver(env)
     coordinate_frame = "local"
     env = RobotLinksObserver(env, coordinate_frame)
     return env
 
 
-def maze_edges_obstacles_curriculum(grid_size):
-    env = MazeGoalObstaclesCurriculum(grid_size)
+def maze_edges_obstacles_curriculum(grid_size, analytic_collision=False):
+    env = MazeGoalObstaclesCurriculum(grid_size, analytic_collision)
     env = MazeObserver(env)
     coordinate_frame = "local"
     env = RobotLinksObserver(env, coordinate_frame)
     return env
 
 
-def maze_raytracing(n_samples, n_rays):
-    env = MazeGoal(grid_size=3)
+def maze_raytracing(n_samples, n_rays, analytic_collision=False, persistent_map=False):
+    env = MazeGoal(grid_size=3, analytic_collision=analytic_collision)
     visibility_radius = 0.7
     memory_distance = 0.06
-    env = RayTracingObserver(env, n_samples, n_rays, visibility_radius, memory_distance)
+    env = RayTracingObserver(
+        env, n_samples, n_rays, visibility_radius, memory_distance, persistent_map
+    )
     coordinate_frame = "local"
     env = RobotLinksObserver(env, coordinate_frame)
     return env
+
+
+def maze_image(
+    grid_size, size, pov, analytic_collision=False, n_scales=1, maze_bank=None
+):
+    env = MazeGoal(grid_size, analytic_collision, maze_bank=maze_bank)
+    visibility_distance = 0.5
+    env = ImageObserver(env, size, pov, visibility_distance, n_scales=n_scales)
+    env = RobotLinksObserver(env, coordinate_frame=pov)
+    return env
@@ -0,0 +1,213 @@
+"""
+Banks of pre-generated mazes of one grid size stored in a .npz file, with the
+walls present in the environment merged into few boxes, the cell adjacency graph
+and the geodesic distances between all the cells, so that resets only pick a maze.
+Cells are indexed by x * grid_size + y, the last n_eval mazes form the eval set.
+"""
+
+import os
+import argparse
+import numpy as np
+
+from mpenv.envs.maze_generator import Maze, make_mazes
+from mpenv.core.utils import CACHE_DIR
+
+# neighbours of a cell in the order W, E, S, N, -1 when a wall separates them
+DIRECTIONS = np.array([[-1, 0], [1, 0], [0, 1], [0, -1]])
+
+_maze_banks = {}
+
+
+def maze_bank_filename(grid_size):
+    """
+    default file of the maze bank of grid_size, generated with
+    python -m mpenv.envs.maze_bank --grid-size grid_size
+    """
+    return os.path.join(CACHE_DIR, f"maze_bank_{grid_size}.npz")
+
+
+def geometry_walls(south, east):
+    """
+    walls built by mpenv.envs.maze.extract_edges, the South walls of the last column
+    and the East walls of the last row are not built apart from the borders
+    """
+    south, east = south.copy(), east.copy()
+    south[-1, :-1] = False
+    east[:-1, -1] = False
+    return south, east
+
+
+def cell_graph(south, east):
+    """
+    neighbours of shape (nx * ny, 4) of the cells reachable without crossing a wall
+    """
+    nx, ny = south.shape
+    x, y = np.divmod(np.arange(nx * ny), ny)
+    open_walls = np.zeros((nx * ny, 4), dtype=bool)
+    open_walls[ny:, 0] = ~east[:-1].ravel()
+    open_walls[:-ny, 1] = ~east[:-1].ravel()
+    open_walls[y < ny - 1, 2] = ~south[:, :-1].ravel()
+    open_walls[y > 0, 3] = ~south[:, :-1].ravel()
+    neighbours = (x[:, None] + DIRECTIONS[:, 0]) * ny + y[:, None] + DIRECTIONS[:, 1]
+    return np.where(open_walls, neighbours, -1)
+
+
+def cell_distances(neighbours):
+    """
+    geodesic distances in cells between all pairs of cells, -1 when unreachable.
+    The breadth first searches from all the cells advance together, each level
+    expands the (source, cell) pairs of the frontiers
+    """
+    n = neighbours.shape[0]
+    dtype = np.int16 if n < np.iinfo(np.int16).max else np.int32
+    distances = np.full((n, n), -1, dtype=dtype)
+    sources = cells = np.arange(n)
+    distances[sources, cells] = 0
+    level = 0
+    while sources.shape[0] > 0:
+        level += 1
+        sources = np.repeat(sources, 4)
+        cells = neighbours[cells].ravel()
+        reached = cells >= 0
+        sources, cells = sources[reached], cells[reached]
+        new = distances[sources, cells] < 0
+        sources, cells = sources[new], cells[new]
+        distances[sources, cells] = level
+        sources, cells = np.divmod(np.unique(sources * n + cells), n)
+    return distances
+
+
+def merged_segments(south, east):
+    """
+    walls as segments x1, y1, x2, y2 where consecutive collinear walls are merged,
+    borders included
+    """
+    nx, ny = south.shape
+    segments = []
+    # horizontal walls at each level y, vertical walls at each level x
+    horizontal = np.vstack((np.ones((1, nx), dtype=bool), south.T))
+    vertical = np.vstack((np.ones((1, ny), dtype=bool), east))
+    for lines, (scale_along, scale_across), transposed in [
+        (horizontal, (nx, ny), False),
+        (vertical, (ny, nx), True),
+    ]:
+        padded = np.pad(lines.astype(np.int8), ((0, 0), (1, 1)))
+        steps = np.diff(padded, axis=1)
+        level, start = np.nonzero(steps == 1)
+        _, end = np.nonzero(steps == -1)
+        across = level / scale_across
+        start, end = start / scale_along, end / scale_along
+        if transposed:
+            segments.append(np.stack((across, start, across, end), axis=1))
+        else:
+            segments.append(np.stack((start, across, end, across), axis=1))
+    return np.vstack(segments)
+
+
+def save_maze_bank(filename, grid_size, n_mazes, n_eval=0, np_random=None):
+    """
+    generate n_mazes mazes and write them with their metadata to filename
+    """
+    if not 0 <= n_eval <= n_mazes:
+        raise ValueError(f"n_eval should be between 0 and {n_mazes}.")
+    mazes = make_mazes(grid_size, grid_size, n_mazes, np_random=np_random)
+    arrays = {
+        "south": np.stack([maze.south for maze in mazes]),
+        "east": np.stack([maze.east for maze in mazes]),
+        "n_eval": np.array(n_eval),
+    }
+    segments, neighbours, distances = [], [], []
+    for maze in mazes:
+        south, east = geometry_walls(maze.south, maze.east)
+        segments.append(merged_segments(south, east))
+        neighbours.append(cell_graph(south, east))
+        distances.append(cell_distances(neighbours[-1]))
+    arrays["segments"] = np.vstack(segments)
+    arrays["segment_offsets"] = np.cumsum([0] + [s.shape[0] for s in segments])
+    arrays["neighbours"] = np.stack(neighbours)
+    arrays["distances"] = np.stack(distances)
+    arrays["diameters"] = arrays["distances"].max(axis=(1, 2))
+    arrays["solvable"] = (arrays["distances"] >= 0).all(axis=(1, 2))
+    os.makedirs(os.path.dirname(os.path.abspath(filename)), exist_ok=True)
+    np.savez(filename, **arrays)
+
+
+def load_maze_bank(filename):
+    """
+    maze bank of filename, loaded once and shared by all the environments of the
+    process
+    """
+    filename = os.path.abspath(filename)
+    if filename not in _maze_banks:
+        _maze_banks[filename] = MazeBank(filename)
+    return _maze_banks[filename]
+
+
+class MazeBank:
+    def __init__(self, filename):
+        if not os.path.exists(filename):
+            raise ValueError(
+                f"No maze bank found: {filename}, generate it with"
+                " python -m mpenv.envs.maze_bank"
+            )
+        with np.load(filename) as data:
+            for key in [
+                "south",
+                "east",
+                "segments",
+                "segment_offsets",
+                "neighbours",
+                "distances",
+                "diameters",
+                "solvable",
+            ]:
+                setattr(self, key, data[key])
+            self.n_eval = int(data["n_eval"])
+        self.grid_size = self.south.shape[1]
+
+    def __len__(self):
+        return self.south.shape[0]
+
+    def split_range(self, split):
+        n_train = len(self) - self.n_eval
+        if split == "train":
+            return 0, n_train
+        elif split == "eval":
+            return n_train, len(self)
+        raise ValueError(f"Invalid split: {split}")
+
+    def sample_index(self, np_random, split="train"):
+        start, end = self.split_range(split)
+        if start == end:
+            raise ValueError(f"The {split} split of the maze bank is empty.")
+        return np_random.randint(start, end)
+
+    def maze(self, idx):
+        maze = Maze(self.grid_size, self.grid_size)
+        maze.south, maze.east = self.south[idx], self.east[idx]
+        return maze
+
+    def maze_segments(self, idx):
+        start, end = self.segment_offsets[idx], self.segment_offsets[idx + 1]
+        return self.segments[start:end]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--grid-size", type=int, default=5)
+    parser.add_argument("--n-mazes", type=int, default=10000)
+    parser.add_argument("--n-eval", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=str, default=None)
+    args = parser.parse_args()
+
+    filename = args.output
+    if filename is None:
+        filename = maze_bank_filename(args.grid_size)
+    np_random = np.random.RandomState(args.seed)
+    save_maze_bank(filename, args.grid_size, args.n_mazes, args.n_eval, np_random)
+    print(f"{args.n_mazes} mazes of size {args.grid_size} written to {filename}")
+
+
+if __name__ == "__main__":
+    main()
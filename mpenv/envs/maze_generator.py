@@ -1,59 +1,35 @@
 # df_maze.py
-import random
+import numpy as np
 
 
 # Create a maze using the depth-first algorithm described at
 # https://scipython.com/blog/making-a-maze/
 # Christian Hill, April 2017.
-
-
-class Cell:
-    """A cell in the maze.
-
-    A maze "Cell" is a point in the grid which may be surrounded by walls to
-    the north, east, south or west.
-
-    """
-
-    # A wall separates a pair of cells in the N-S or W-E directions.
-    wall_pairs = {"N": "S", "S": "N", "E": "W", "W": "E"}
-
-    def __init__(self, x, y):
-        """Initialize the cell at (x,y). At first it is surrounded by walls."""
-
-        self.x, self.y = x, y
-        self.walls = {"N": True, "S": True, "E": True, "W": True}
-
-    def has_all_walls(self):
-        """Does this cell still have all its walls?"""
-
-        return all(self.walls.values())
-
-    def knock_down_wall(self, other, wall):
-        """Knock down the wall between cells self and other."""
-
-        self.walls[wall] = False
-        other.walls[Cell.wall_pairs[wall]] = False
+# Walls are stored as two boolean arrays of shape (nx, ny), south[x, y] is the wall
+# between cells (x, y) and (x, y + 1), east[x, y] the wall between (x, y) and
+# (x + 1, y).
 
 
 class Maze:
     """A Maze, represented as a grid of cells."""
 
-    def __init__(self, nx, ny, ix=0, iy=0):
+    def __init__(self, nx, ny, ix=0, iy=0, np_random=None):
         """Initialize the maze grid.
         The maze consists of nx x ny cells and will be constructed starting
-        at the cell indexed at (ix, iy).
+        at the cell indexed at (ix, iy). At first every cell is surrounded by walls.
 
         """
 
         self.nx, self.ny = nx, ny
         self.ix, self.iy = ix, iy
-        self.maze_map = [[Cell(x, y) for y in range(ny)] for x in range(nx)]
+        self.np_random = np_random if np_random is not None else np.random
+        self.south = np.ones((nx, ny), dtype=bool)
+        self.east = np.ones((nx, ny), dtype=bool)
 
-    def cell_at(self, x, y):
-        """Return the Cell object at (x,y)."""
+    def wall_bitmaps(self):
+        """Return boolean arrays of shape (nx, ny) of the South and East walls."""
 
-        return self.maze_map[x][y]
+        return self.south, self.east
 
     def __str__(self):
         """Return a (crude) string representation of the maze."""
@@ -62,17 +38,11 @@ class Maze:
         for y in range(self.ny):
             maze_row = ["|"]
             for x in range(self.nx):
-                if self.maze_map[x][y].walls["E"]:
-                    maze_row.append(" |")
-                else:
-                    maze_row.append("  ")
+                maze_row.append(" |" if self.east[x, y] else "  ")
             maze_rows.append("".join(maze_row))
             maze_row = ["|"]
             for x in range(self.nx):
-                if self.maze_map[x][y].walls["S"]:
-                    maze_row.append("-+")
-                else:
-                    maze_row.append(" +")
+                maze_row.append("-+" if self.south[x, y] else " +")
             maze_rows.append("".join(maze_row))
         return "\n".join(maze_rows)
 
@@ -125,7 +95,7 @@ class Maze:
             # general, of course).
             for x in range(self.nx):
                 for y in range(self.ny):
-                    if self.cell_at(x, y).walls["S"]:
+                    if self.south[x, y]:
                         x1, y1, x2, y2 = (
                             x * scx,
                             (y + 1) * scy,
@@ -133,7 +103,7 @@ class Maze:
                             (y + 1) * scy,
                         )
                         write_wall(f, x1, y1, x2, y2)
-                    if self.cell_at(x, y).walls["E"]:
+                    if self.east[x, y]:
                         x1, y1, x2, y2 = (
                             (x + 1) * scx,
                             y * scy,
@@ -147,38 +117,166 @@ class Maze:
             print('<line x1="0" y1="0" x2="0" y2="{}"/>'.format(height), file=f)
             print("</svg>", file=f)
 
-    def find_valid_neighbours(self, cell):
-        """Return a list of unvisited neighbours to cell."""
+    def make_maze(self, draws=None):
+        """Carve the maze with an iterative depth-first search.
+        Each move to an unvisited neighbour consumes one uniform draw in [0, 1),
+        the nx * ny - 1 draws are sampled from np_random when not given.
 
-        delta = [("W", (-1, 0)), ("E", (1, 0)), ("S", (0, 1)), ("N", (0, -1))]
-        neighbours = []
-        for direction, (dx, dy) in delta:
-            x2, y2 = cell.x + dx, cell.y + dy
-            if (0 <= x2 < self.nx) and (0 <= y2 < self.ny):
-                neighbour = self.cell_at(x2, y2)
-                if neighbour.has_all_walls():
-                    neighbours.append((direction, neighbour))
-        return neighbours
+        """
 
-    def make_maze(self):
+        nx, ny = self.nx, self.ny
         # Total number of cells.
-        n = self.nx * self.ny
+        n = nx * ny
+        if draws is None:
+            draws = self.np_random.random_sample(n - 1)
+        draws = np.asarray(draws).tolist()
+        # Cells are indexed by x * ny + y as in the wall arrays.
+        visited = [False] * n
+        south = [True] * n
+        east = [True] * n
         cell_stack = []
-        current_cell = self.cell_at(self.ix, self.iy)
+        x, y = self.ix, self.iy
+        visited[x * ny + y] = True
         # Total number of visited cells during maze construction.
         nv = 1
 
         while nv < n:
-            neighbours = self.find_valid_neighbours(current_cell)
+            cell = x * ny + y
+            neighbours = []
+            if x > 0 and not visited[cell - ny]:
+                neighbours.append(0)
+            if x < nx - 1 and not visited[cell + ny]:
+                neighbours.append(1)
+            if y < ny - 1 and not visited[cell + 1]:
+                neighbours.append(2)
+            if y > 0 and not visited[cell - 1]:
+                neighbours.append(3)
 
             if not neighbours:
                 # We've reached a dead end: backtrack.
-                current_cell = cell_stack.pop()
+                x, y = cell_stack.pop()
                 continue
 
-            # Choose a random neighbouring cell and move to it.
-            direction, next_cell = random.choice(neighbours)
-            current_cell.knock_down_wall(next_cell, direction)
-            cell_stack.append(current_cell)
-            current_cell = next_cell
+            # Choose a random neighbouring cell, knock down the wall and move to it.
+            direction = neighbours[int(draws[nv - 1] * len(neighbours))]
+            cell_stack.append((x, y))
+            if direction == 0:
+                east[cell - ny] = False
+                x -= 1
+            elif direction == 1:
+                east[cell] = False
+                x += 1
+            elif direction == 2:
+                south[cell] = False
+                y += 1
+            else:
+                south[cell - 1] = False
+                y -= 1
+            visited[x * ny + y] = True
             nv += 1
+
+        self.south = np.array(south).reshape(nx, ny)
+        self.east = np.array(east).reshape(nx, ny)
+
+
+# Batches of at least BATCH_CARVE_MIN mazes are carved in lockstep, below that size
+# the numpy overhead of each step exceeds the cost of carving mazes one at a time.
+# Lockstep carving holds a stack of nx * ny cells per maze, batches are carved by
+# chunks of at most BATCH_CARVE_MAX mazes.
+BATCH_CARVE_MIN = 256
+BATCH_CARVE_MAX = 2048
+
+
+def carve_mazes(nx, ny, draws, ix=0, iy=0):
+    """Carve one maze per row of draws with the depth-first search of
+    Maze.make_maze, all the mazes advancing together by one move or backtrack per
+    step. Return the South and East wall arrays of shape (n_mazes, nx, ny).
+
+    """
+
+    n_mazes, n = draws.shape[0], nx * ny
+    mazes = np.arange(n_mazes)
+    cells = np.arange(n)
+    x, y = np.divmod(cells, ny)
+    # neighbours of each cell in the order W, E, S, N, n when out of the maze
+    neighbours = np.stack(
+        (
+            np.where(x > 0, cells - ny, n),
+            np.where(x < nx - 1, cells + ny, n),
+            np.where(y < ny - 1, cells + 1, n),
+            np.where(y > 0, cells - 1, n),
+        ),
+        axis=1,
+    )
+    # the last column stands for the cells out of the maze, always visited
+    visited = np.zeros((n_mazes, n + 1), dtype=bool)
+    visited[:, n] = True
+    south = np.ones((n_mazes, n), dtype=bool)
+    east = np.ones((n_mazes, n), dtype=bool)
+    cell_stack = np.zeros((n_mazes, n), dtype=np.int64)
+    depth = np.zeros(n_mazes, dtype=np.int64)
+    cell = np.full(n_mazes, ix * ny + iy)
+    visited[mazes, cell] = True
+    # number of visited cells of each maze
+    nv = np.ones(n_mazes, dtype=np.int64)
+
+    active = mazes[nv < n]
+    while active.shape[0] > 0:
+        current = cell[active]
+        candidates = neighbours[current]
+        unvisited = ~visited[active[:, None], candidates]
+        n_unvisited = unvisited.sum(axis=1)
+
+        # backtrack the mazes at a dead end
+        dead_end = n_unvisited == 0
+        back = active[dead_end]
+        depth[back] -= 1
+        cell[back] = cell_stack[back, depth[back]]
+
+        # move the other mazes to the unvisited neighbour chosen by their draw
+        moving = ~dead_end
+        move = active[moving]
+        current, candidates = current[moving], candidates[moving]
+        choice = (draws[move, nv[move] - 1] * n_unvisited[moving]).astype(np.int64)
+        rank = np.cumsum(unvisited[moving], axis=1)
+        direction = np.argmax(rank > choice[:, None], axis=1)
+        target = candidates[np.arange(move.shape[0]), direction]
+        cell_stack[move, depth[move]] = current
+        depth[move] += 1
+        # W and N knock down a wall of the target, E and S a wall of the cell
+        wall_cell = np.where(direction % 3 == 0, target, current)
+        is_east = direction < 2
+        east[move[is_east], wall_cell[is_east]] = False
+        south[move[~is_east], wall_cell[~is_east]] = False
+        cell[move] = target
+        visited[move, target] = True
+        nv[move] += 1
+        active = active[nv[active] < n]
+
+    return south.reshape(n_mazes, nx, ny), east.reshape(n_mazes, nx, ny)
+
+
+def make_mazes(nx, ny, n_mazes, ix=0, iy=0, np_random=None):
+    """Carve n_mazes mazes, the draws of all the mazes are sampled at once and maze i
+    is carved with the draws of row i. Large batches are carved in lockstep by
+    carve_mazes, small ones one maze at a time, both give the same mazes.
+
+    """
+
+    np_random = np_random if np_random is not None else np.random
+    draws = np_random.random_sample((n_mazes, nx * ny - 1))
+    mazes = []
+    for start in range(0, n_mazes, BATCH_CARVE_MAX):
+        batch_draws = draws[start : start + BATCH_CARVE_MAX]
+        if batch_draws.shape[0] < BATCH_CARVE_MIN:
+            for maze_draws in batch_draws:
+                maze = Maze(nx, ny, ix, iy, np_random)
+                maze.make_maze(maze_draws)
+                mazes.append(maze)
+            continue
+        south, east = carve_mazes(nx, ny, batch_draws, ix, iy)
+        for maze_south, maze_east in zip(south, east):
+            maze = Maze(nx, ny, ix, iy, np_random)
+            maze.south, maze.east = maze_south, maze_east
+            mazes.append(maze)
+    return mazes
@@ -1,4 +1,5 @@
 import os
+import hashlib
 import numpy as np
 from gym import spaces
 import hppfcl
@@ -13,7 +14,10 @@ from mpenv.envs.base import Base
 from mpenv.envs import utils as envs_utils
 from mpenv.envs.utils import ROBOTS_PROPS
 from mpenv.core import utils
+from mpenv.core.utils import CACHE_DIR
+from mpenv.core import boxes2d
 from mpenv.core.geometry import Geometries
+from mpenv.core.sdf import SDF2D
 
 from mpenv.observers.robot_links import RobotLinksObserver
 from mpenv.observers.point_cloud import PointCloudObserver
@@ -22,9 +26,22 @@ from mpenv.observers.image import ImageObserver
 
 
 class NarrowGoal(Base):
-    def __init__(self, max_env_idx=None):
+    def __init__(
+        self,
+        max_env_idx=None,
+        analytic_collision=False,
+        sdf_resolution=None,
+        sdf_cache_dir=None,
+    ):
         super().__init__(robot_name="sphere")
 
+        self.analytic_collision = analytic_collision
+        self.continuous_collision = analytic_collision
+        self.incremental_reset = True
+        self.sdf_resolution = sdf_resolution
+        # the SDF of each layout is stored there, keyed by split and idx_env
+        self.sdf_cache_dir = sdf_cache_dir
+
         self.num_obstacles = 5
         self.max_env_idx = max_env_idx
         self.grid_size = 10
@@ -38,17 +55,17 @@ class NarrowGoal(Base):
         )
 
         self.x, self.c = load_obstacles_from_data(train=True)
+        self.data_split = "train"
 
         self.normalizer_local = {"mean": 0.0, "std": 0.3}
         self.normalizer_global = {"mean": 0.5, "std": 0.5}
 
     def _reset(self, idx_env=None, start=None, goal=None):
-        model_wrapper = self.model_wrapper
-        self.robot = self.add_robot("sphere2d", self.freeflyer_bounds)
         self.geoms, self.idx_env = self.get_obstacles_geoms(idx_env)
-        for geom_obj in self.geoms.geom_objs:
-            self.add_obstacle(geom_obj, static=True)
-        model_wrapper.create_data()
+        self.build_world("sphere2d", self.freeflyer_bounds, self.geoms.geom_objs)
+        self.boxes2d = boxes2d.from_geom_objs(self.geoms.geom_objs)
+        if self.sdf_resolution is not None:
+            self.sdf = self.compute_sdf()
 
         valid_sample = False
         while not valid_sample:
@@ -64,11 +81,8 @@ class NarrowGoal(Base):
 
     def validate_sample(self, state, goal_state):
         "Filter start and goal with straight path solution"
-        straight_path = self.model_wrapper.arange(
-            state, goal_state, self.delta_collision_check
-        )
-        _, collide = self.stopping_configuration(straight_path)
-        return collide
+        straight_path = self.motion_path(state, goal_state)
+        return self.path_collides(straight_path)
 
     def get_obstacles_geoms(self, idx_env):
         np_random = self._np_random
@@ -82,7 +96,7 @@ class NarrowGoal(Base):
 
         c = self.c[idx_env]
         geom_objs = extract_obstacles(c, self.num_obstacles)
-        geoms = Geometries(geom_objs)
+        geoms = Geometries(geom_objs, self.union_cache_dir, self.lazy_union)
         return geoms, idx_env
 
     def compute_surface_pcd(self, n_pts):
@@ -91,24 +105,23 @@ class NarrowGoal(Base):
     def compute_volume_pcd(self, n_pts):
         return obstacles_to_volume_2dpcd(self.geoms, n_pts)
 
-    def compute_occupancy_grid(self, size):
-        def collision(pts):
-            collisions = np.zeros(pts.shape[0])
-            for i, pt in enumerate(pts):
-                if 0 <= pt[0] <= 1 and 0 <= pt[1] <= 1:
-                    q = np.zeros(7)
-                    q[-1] = 1
-                    q[:2] = pt
-                    collisions[i] = self.model_wrapper.collision(q)
-                else:
-                    collisions[i] = True
-
-            return collisions
-
-        return obstacles_to_occupancy_grid(size, collision)
+    def compute_sdf(self):
+        if self.sdf_cache_dir is None:
+            return super().compute_sdf()
+        filename = os.path.join(
+            self.sdf_cache_dir,
+            f"narrow_{self.data_split}_{self.idx_env}_{self.sdf_resolution}.npz",
+        )
+        if os.path.exists(filename):
+            return SDF2D.load(filename)
+        sdf = super().compute_sdf()
+        os.makedirs(self.sdf_cache_dir, exist_ok=True)
+        sdf.save(filename)
+        return sdf
 
     def set_eval(self):
         self.x, self.c = load_obstacles_from_data(train=False)
+        self.data_split = "eval"
 
     def render_matplotlib(self):
         fig = plt.figure(figsize=(10, 6), dpi=80)
@@ -136,18 +149,18 @@ class NarrowGoal(Base):
         return fig, ax
 
 
-def load_obstacles_from_data(train):
-    csv_filename = os.path.join(os.path.dirname(__file__), "../assets/narrow_data.csv")
+NARROW_DATA_CSV = os.path.join(os.path.dirname(__file__), "../assets/narrow_data.csv")
+# parsed data of each csv file, shared by the environments of the process
+_narrow_data = {}
+
+
+def load_obstacles_from_data(train, csv_filename=NARROW_DATA_CSV):
     ratio_train = 0.8
     # problem dimension
     state_dim = 6
 
     w_dim = 3
-    num_gaps = 3
-    # sample (6D), gap1 (2D, 1D orientation), gap2, gap3, init (6D), goal (6D)
-    dim_data = state_dim + num_gaps * w_dim + 2 * state_dim
-    # dimension of conditioning variable
-    data = read_csv(csv_filename, dim_data)
+    data = load_narrow_data(csv_filename)
     n_train = int(data.shape[0] * ratio_train)
     # state: x, y, z, xdot, ydot, zdot
     x = data[:, :state_dim]
@@ -160,6 +173,47 @@ def load_obstacles_from_data(train):
     return x, c
 
 
+def load_narrow_data(csv_filename=NARROW_DATA_CSV, cache_dir=CACHE_DIR):
+    """
+    samples and gaps of the csv file, parsed once into a .npy file of cache_dir
+    which is then memory-mapped and shared by all the environments of the process
+    """
+    if csv_filename in _narrow_data:
+        return _narrow_data[csv_filename]
+    state_dim = 6
+    w_dim = 3
+    num_gaps = 3
+    # sample (6D), gap1 (2D, 1D orientation), gap2, gap3, init (6D), goal (6D)
+    dim_data = state_dim + num_gaps * w_dim + 2 * state_dim
+    # only keep the samples and the gaps
+    n_columns = state_dim + num_gaps * w_dim
+    # csv files of the same name in different directories have their own cache
+    name = os.path.splitext(os.path.basename(csv_filename))[0]
+    key = hashlib.md5(os.path.abspath(csv_filename).encode()).hexdigest()[:8]
+    npy_filename = os.path.join(cache_dir, f"{name}_{key}.npy")
+    data = None
+    if os.path.exists(npy_filename) and (
+        os.path.getmtime(npy_filename) >= os.path.getmtime(csv_filename)
+    ):
+        data = np.load(npy_filename, mmap_mode="r")
+        if data.ndim != 2 or data.shape[1] != n_columns:
+            data = None
+    if data is None:
+        data = read_csv(csv_filename, dim_data)[:, :n_columns]
+        try:
+            # write then rename so that concurrent readers never see a partial file
+            os.makedirs(cache_dir, exist_ok=True)
+            tmp_filename = f"{npy_filename}.{os.getpid()}.tmp.npy"
+            np.save(tmp_filename, data)
+            os.replace(tmp_filename, npy_filename)
+            data = np.load(npy_filename, mmap_mode="r")
+        except OSError:
+            # read-only cache, keep the parsed data in memory
+            pass
+    _narrow_data[csv_filename] = data
+    return data
+
+
 def read_csv(filename, dim_data):
     count = 0
     data_list = []
@@ -231,44 +285,31 @@ def obstacles_to_volume_2dpcd(geoms, n_pts):
     return points
 
 
-def obstacles_to_occupancy_grid(grid_size, collision):
-    cond_occ = np.zeros((grid_size * grid_size))
-    occ_grid_samples = np.zeros((grid_size * grid_size, 2))
-    grid_points_range = np.linspace(0, 1, num=grid_size + 1)[:-1] + 1 / (2 * grid_size)
-
-    idx = 0
-    for j, y in enumerate(grid_points_range):
-        for i, x in enumerate(grid_points_range):
-            # cond_occ_xy[1:, j, i] = np.array([x, y])
-            occ_grid_samples[idx, 0] = x
-            occ_grid_samples[idx, 1] = y
-            idx += 1
-
-    occ_grid = collision(occ_grid_samples)
-
-    return occ_grid, occ_grid_samples
-
-
 def narrow_pointcloud(
-    max_env_idx, n_samples, on_surface, add_normals, coordinate_frame
+    max_env_idx,
+    n_samples,
+    on_surface,
+    add_normals,
+    coordinate_frame,
+    analytic_collision=False,
 ):
-    env = NarrowGoal(max_env_idx)
+    env = NarrowGoal(max_env_idx, analytic_collision)
     env = PointCloudObserver(env, n_samples, coordinate_frame, on_surface, add_normals)
     env = RobotLinksObserver(env, coordinate_frame)
     return env
 
 
-def narrow_corners(max_env_idx):
-    env = NarrowGoal(max_env_idx)
+def narrow_corners(max_env_idx, analytic_collision=False):
+    env = NarrowGoal(max_env_idx, analytic_collision)
     coordinate_frame = "local"
     env = CornersObserver(env, coordinate_frame)
     env = RobotLinksObserver(env, coordinate_frame)
     return env
 
 
-def narrow_image(max_env_idx, size, pov):
-    env = NarrowGoal(max_env_idx)
+def narrow_image(max_env_idx, size, pov, analytic_collision=False, n_scales=1):
+    env = NarrowGoal(max_env_idx, analytic_collision)
     visibility_distance = 0.5
-    env = ImageObserver(env, size, pov, visibility_distance)
+    env = ImageObserver(env, size, pov, visibility_distance, n_scales=n_scales)
     env = RobotLinksObserver(env, coordinate_frame=pov)
     return env
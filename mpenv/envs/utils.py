@@ -6,7 +6,8 @@ import pinocchio as pin
 import eigenpy
 
 from mpenv.core.mesh import Mesh
-from mpenv.core.geometry import Geometries
+from mpenv.core.geometry import Geometries, UNION_CACHE_DIR
+from mpenv.core.dataset import GeometriesDataset
 
 
 LINVEL_RANGE = np.array([0.07, 0.07, 0.07])
@@ -44,12 +45,18 @@ ROBOTS_PROPS = {
 }
 
 
-def load_dataset_geoms(filename):
+def load_dataset_geoms(filename, cache_dir=UNION_CACHE_DIR, lazy_union=False):
+    """
+    worlds of a pickled list of geometries dicts, or of a columnar dataset directory
+    which is memory-mapped and decoded lazily
+    """
+    if os.path.isdir(filename):
+        return GeometriesDataset(filename, cache_dir, lazy_union)
     with open(filename, "rb") as f:
         geoms_pkl = pkl.load(f)
     dataset_geoms = []
     for geoms_dict in geoms_pkl["geoms_dicts"]:
-        geoms = Geometries()
+        geoms = Geometries(cache_dir=cache_dir, lazy_union=lazy_union)
         geoms.from_dict(geoms_dict)
         dataset_geoms.append(geoms)
     return dataset_geoms
@@ -11,6 +11,8 @@ class BaseObserver(gym.ObservationWrapper):
         self.obs_shape = self.env.obs_shape
         self.obs_indices = self.env.obs_indices
         self.observation_space = self.env.observation_space
+        # slices of the observations added by this observer
+        self.obs_slices = {}
 
     def set_eval(self):
         self.env.set_eval()
@@ -32,10 +34,25 @@ class BaseObserver(gym.ObservationWrapper):
         else:
             self.obs_indices[name] = slice(self.obs_shape, self.obs_shape + obs_size)
             self.obs_shape += obs_size
+        self.obs_slices[name] = self.obs_indices[name]
         self.update_observation_box("observation", self.obs_shape)
 
+    def write_observation(self, obs, name, value):
+        """
+        write value in place in the slice of the flat observation buffer given by
+        the layout of add_observation
+        """
+        obs["observation"][self.obs_slices[name]] = value
+
+    def observation_slice(self, obs, name):
+        """
+        view of the slice of the flat observation buffer given by the layout of
+        add_observation, representations can be computed directly into it
+        """
+        return obs["observation"][self.obs_slices[name]]
+
     def update_observation_box(self, name, shape):
         box = self.observation_space[name]
-        box.low = -np.ones(shape)
-        box.high = np.ones(shape)
+        box.low = -np.ones(shape, dtype=box.dtype)
+        box.high = np.ones(shape, dtype=box.dtype)
         box.shape = (shape,)
@@ -53,9 +53,7 @@ class CornersObserver(BaseObserver):
         current_state, goal_state = state["current"], state["goal"]
         obs_wrapper = self.compute_obs(current_state)
 
-        obs["observation"] = np.concatenate(
-            (obs["observation"], obs_wrapper["corners"])
-        )
+        self.write_observation(obs, "obstacles", obs_wrapper["corners"])
 
         return obs
 
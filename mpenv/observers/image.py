@@ -1,3 +1,4 @@
+import math
 import numpy as np
 
 import gym
@@ -9,15 +10,26 @@ from mpenv.observers.base import BaseObserver
 
 
 class ImageObserver(BaseObserver):
-    def __init__(self, env, img_shape, pov, visibility_distance):
+    def __init__(
+        self, env, img_shape, pov, visibility_distance, supersampling=1, n_scales=1
+    ):
         super().__init__(env)
 
         self.img_shape = img_shape
-        self.obstacles_dim = np.prod(self.img_shape)
+        self.supersampling = supersampling
+        # local views of the grid downsampled by 2, 4, ... covering larger areas
+        self.n_scales = n_scales
+        self.obstacles_dim = n_scales * np.prod(self.img_shape)
 
         self.pov = pov
         if pov not in ["local", "global"]:
             raise ValueError(f"Invalid point of view: {pov}")
+        if n_scales > 1 and pov != "local":
+            raise ValueError("Multiple scales are only supported for local views.")
+        if any(size % 2 ** (n_scales - 1) for size in img_shape):
+            raise ValueError(f"Image shape not divisible by {2 ** (n_scales - 1)}.")
+        # padding of the canvas so that local views are slices of it
+        self.padding = np.array(img_shape) // 2 + 2
 
         self.visibility_distance = visibility_distance
 
@@ -27,83 +39,71 @@ class ImageObserver(BaseObserver):
     def reset(self, **kwargs):
         o = self.env.reset(**kwargs)
         self.occ_grid, self.occ_grid_samples = self.env.compute_occupancy_grid(
-            self.img_shape[0]
+            self.img_shape[0], self.supersampling
         )
+        if self.pov == "local":
+            self.canvases = self.padded_canvases(self.occ_grid)
         o = self.observation(o)
         return o
 
+    def padded_canvases(self, occ_grid):
+        """
+        grid of each scale padded with occupied cells
+        """
+        canvases = []
+        grid = occ_grid.reshape(self.img_shape)
+        pad_y, pad_x = self.padding
+        for scale in range(self.n_scales):
+            if scale > 0:
+                h, w = grid.shape
+                grid = grid.reshape(h // 2, 2, w // 2, 2).mean(axis=(1, 3))
+            canvas = np.ones((grid.shape[0] + 2 * pad_y, grid.shape[1] + 2 * pad_x))
+            canvas[pad_y:-pad_y, pad_x:-pad_x] = grid
+            canvases.append(canvas)
+        return canvases
+
+    def shift(self, pixel, size):
+        """
+        shift of the grid in the local view, the robot pixel ends up next to the center
+        """
+        center = int(size / 2)
+        if pixel <= size / 2:
+            return center - pixel + 1
+        return -(pixel - center + 1)
+
     def compute_obs(self, state, goal_state):
         q, oMi, oMg = state.q_oM
-        goal_q, goal_oMi, goal_oMg = goal_state.q_oM
+        height, width = self.img_shape
 
         ee_pos = self.env.robot.get_ee(oMg).translation[:2]
-        goal_ee_pos = self.env.robot.get_ee(goal_oMg).translation[:2]
-
-        occ_grid = self.occ_grid.copy()
-
-        nearest_to_robot = np.linalg.norm(
-            self.occ_grid_samples - ee_pos, axis=1
-        ).argmin()
-        nearest_to_goal = np.linalg.norm(
-            self.occ_grid_samples - goal_ee_pos, axis=1
-        ).argmin()
-        occ_grid[nearest_to_robot] = 0.5
-
-        if self.pov == "local":
-            squared_occ = occ_grid.reshape(self.img_shape)
-            local_occ_grid = np.ones((self.img_shape[0], self.img_shape[1]))
+        # cell nearest to the robot, ties go to the lower cell
+        ee_x = min(max(math.ceil(ee_pos[0] * width - 1), 0), width - 1)
+        ee_y = min(max(math.ceil(ee_pos[1] * height - 1), 0), height - 1)
+
+        if self.pov == "global":
+            obstacles_img = self.occ_grid.copy()
+            obstacles_img[ee_y * width + ee_x] = 0.5
+        else:
             current_x, current_y = q[:2]
-            y_center_pixel, x_center_pixel = (
-                int(self.img_shape[0] / 2),
-                int(self.img_shape[1] / 2),
-            )
-            current_x_pixel, current_y_pixel = (
-                int(current_x * self.img_shape[1]),
-                int(current_y * self.img_shape[0]),
-            )
-            x_diff = np.abs(x_center_pixel - current_x_pixel)
-            y_diff = np.abs(y_center_pixel - current_y_pixel)
-            x_offset = x_diff + 1
-            y_offset = y_diff + 1
-
-            if (
-                current_x_pixel <= self.img_shape[1] / 2
-                and current_y_pixel <= self.img_shape[0] / 2
-            ):
-                local_occ_grid[y_offset:, x_offset:] = squared_occ[
-                    :-y_offset, :-x_offset
-                ]
-            elif (
-                current_x_pixel <= self.img_shape[1] / 2
-                and current_y_pixel > self.img_shape[0] / 2
-            ):
-                local_occ_grid[:-y_offset, x_offset:] = squared_occ[
-                    y_offset:, :-x_offset
-                ]
-            elif (
-                current_x_pixel > self.img_shape[1] / 2
-                and current_y_pixel <= self.img_shape[0] / 2
-            ):
-                local_occ_grid[y_offset:, :-x_offset] = squared_occ[
-                    :-y_offset:, x_offset:
-                ]
-            else:
-                local_occ_grid[:-y_offset, :-x_offset] = squared_occ[
-                    y_offset:, x_offset:
-                ]
-
-            occ_grid = local_occ_grid.flatten()
-
-        obstacles_img = occ_grid.reshape(self.img_shape)
+            pad_y, pad_x = self.padding
+            views = []
+            for scale, canvas in enumerate(self.canvases):
+                shift_x = self.shift(int(current_x * (width >> scale)), width)
+                shift_y = self.shift(int(current_y * (height >> scale)), height)
+                start_x, start_y = pad_x - shift_x, pad_y - shift_y
+                view = canvas[start_y : start_y + height, start_x : start_x + width]
+                view = view.copy()
+                view[(ee_y >> scale) + shift_y, (ee_x >> scale) + shift_x] = 0.5
+                views.append(view.flatten())
+            obstacles_img = np.concatenate(views)
 
         # Visualize image
         # plt.ion()
-        # plt.imshow(obstacles_img)
+        # plt.imshow(obstacles_img[: height * width].reshape(self.img_shape))
         # plt.draw()
         # plt.pause(0.001)
         # plt.ioff()
 
-        obstacles_img = obstacles_img.flatten()
         obstacles_img = (obstacles_img - 0.5) / 0.5
 
         return {"img": obstacles_img}
@@ -113,7 +113,7 @@ class ImageObserver(BaseObserver):
         current_state, goal_state = state["current"], state["goal"]
         obs_wrapper = self.compute_obs(current_state, goal_state)
 
-        obs["observation"] = np.concatenate((obs["observation"], obs_wrapper["img"]))
+        self.write_observation(obs, "obstacles", obs_wrapper["img"])
 
         return obs
 
@@ -21,50 +21,42 @@ class MazeObserver(BaseObserver):
 
         # update observation definition to add the obstacles representation
         self.add_observation("obstacles", self.obstacles_dim)
+        self.edges_flat = np.zeros(self.obstacles_dim)
 
     def reset(self, **kwargs):
         o = self.env.reset(**kwargs)
-        edges = []
-        geom_objs = self.env.geoms.geom_objs
-        for i, obst in enumerate(geom_objs):
-            x, y = obst.placement.translation[:2]
-            half_side = obst.geometry.halfSide
-            w, h = 2 * half_side[:2]
-            w = np.max(w - self.env.thickness, 0)
-            h = np.max(h - self.env.thickness, 0)
-            edges.append([x - w / 2, y - h / 2, x + w / 2, y + h / 2])
-        edges = np.array(edges)
-        self.edges = edges
+        self.edges = self.env.edges
+        # padded edges are zeros, the edges are written in place at each step
+        self.edges_flat[:] = 0
         o = self.observation(o)
         return o
 
-    def represent_obstacles(self, edges, ee_pos):
-        edges = edges.copy()
+    def represent_obstacles(self, edges, ee_pos, out=None):
+        """
+        edges in the frame centered on ee_pos, padded, flattened and followed by the
+        number of edges, written into out
+        """
+        if out is None:
+            out = np.zeros(self.obstacles_dim)
+        n_edges = edges.shape[0]
+        edges_pad = out[:-1].reshape(self.max_edges, self.obstacle_point_dim)
 
         # local coordinate frame
-        centers = (edges[:, :2] + edges[:, 2:]) / 2
-        dist = np.linalg.norm(centers - ee_pos[:2], axis=1)
-        edges[:, [0, 2]] -= ee_pos[0]
-        edges[:, [1, 3]] -= ee_pos[1]
-        # edges = edges[dist < self.visible_cells / self.env.maze.nx]
+        np.subtract(edges, ee_pos[[0, 1, 0, 1]], out=edges_pad[:n_edges])
 
         # uncomment for visualization
         # p0 = np.hstack((edges[:, :2], np.zeros((edges.shape[0], 1))))
         # p1 = np.hstack((edges[:, 2:], np.zeros((edges.shape[0], 1))))
         # self.env.o3d_viz.show_lines(p0, p1, blocking=False)
 
-        edges_pad = np.zeros((self.max_edges, self.obstacle_point_dim))
-        edges_pad[: edges.shape[0]] = edges
-        edges_pad = edges_pad.flatten()
         # add number of edges as last index
-        edges_pad = np.hstack((edges_pad, edges.shape[0]))
-
-        return edges_pad
+        out[-1] = n_edges
+        return out
 
     def compute_obs(self, state):
         q, oMi, oMg = state.q_oM
         ee_pos = self.env.robot.get_ee(oMg).translation
-        edges = self.represent_obstacles(self.edges, ee_pos)
+        edges = self.represent_obstacles(self.edges, ee_pos, self.edges_flat)
 
         return {"edges": edges}
 
@@ -73,6 +65,6 @@ class MazeObserver(BaseObserver):
         current_state, goal_state = state["current"], state["goal"]
         obs_wrapper = self.compute_obs(current_state)
 
-        obs["observation"] = np.concatenate((obs["observation"], obs_wrapper["edges"]))
+        self.write_observation(obs, "obstacles", obs_wrapper["edges"])
 
         return obs
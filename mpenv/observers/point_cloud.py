@@ -4,7 +4,7 @@ from gym import spaces
 from gym.spaces import Dict
 
 from mpenv.observers.base import BaseObserver
-from mpenv.core import utils
+from mpenv.core import se3
 
 
 class PointCloudObserver(BaseObserver):
@@ -34,7 +34,12 @@ class PointCloudObserver(BaseObserver):
 
     def compute_pcd(self):
         if self.on_surface:
-            points, normals = self.env.compute_surface_pcd(self.n_samples)
+            # worlds of a dataset can store their point cloud, used as it is
+            stored = self.env.stored_surface_pcd(self.n_samples)
+            if stored is not None and (stored[1] is not None or not self.add_normals):
+                points, normals = stored
+            else:
+                points, normals = self.env.compute_surface_pcd(self.n_samples)
             if self.add_normals:
                 obstacles_pcd = np.hstack((points, normals))
             else:
@@ -43,27 +48,31 @@ class PointCloudObserver(BaseObserver):
             obstacles_pcd = self.env.compute_volume_pcd(self.n_samples)
         return obstacles_pcd
 
-    def represent_obstacles(self, oMi, obstacles_pcd):
-        obstacles_repr = obstacles_pcd.copy()
-
-        ref = oMi[1]
-        ref_inv = ref.inverse()
-        points, normals = obstacles_repr[:, :3], obstacles_repr[:, 3:]
+    def represent_obstacles(self, oMi, obstacles_pcd, out=None):
+        """
+        points and normals in the reference frame, points normalized, flattened
+        and followed by the number of points. The transform and the normalization
+        are fused in one affine map written directly into out
+        """
+        n_points = obstacles_pcd.shape[0]
+        if out is None:
+            out = np.empty(n_points * self.obstacle_point_dim + 1)
+        obstacles_repr = out[:-1].reshape(n_points, self.obstacle_point_dim)
+        points = obstacles_pcd[:, :3]
 
         if self.coordinate_frame == "local":
-            points_ref = utils.apply_transformation(ref_inv, points)
+            ref_inv = se3.inverse(oMi[1])
+            rotation, translation = ref_inv[:3, :3], ref_inv[:3, 3]
+            normalizer = self.normalizer_local
         elif self.coordinate_frame == "global":
-            points_ref = points
+            rotation, translation = np.eye(3), np.zeros(3)
+            normalizer = self.normalizer_global
+        scale = 1 / normalizer["std"]
 
+        np.matmul(points, scale * rotation.T, out=obstacles_repr[:, :3])
+        obstacles_repr[:, :3] += scale * (translation - normalizer["mean"])
         if self.add_normals:
-            if self.coordinate_frame == "local":
-                normals_ref = normals.dot(ref_inv.rotation.T)
-            elif self.coordinate_frame == "global":
-                normals_ref = normals
-
-            obstacles_repr = np.hstack((points_ref, normals_ref))
-        else:
-            obstacles_repr = points_ref
+            np.matmul(obstacles_pcd[:, 3:], rotation.T, out=obstacles_repr[:, 3:])
 
         # uncomment for visualization
         # points, normals = obstacles_pcd[:, :3], obstacles_pcd[:, 3:]
@@ -71,21 +80,16 @@ class PointCloudObserver(BaseObserver):
         # normals = np.zeros_like(points)
         # self.env.o3d_viz.show_pcd(points, normals, blocking=False)
 
-        obstacles_repr[:, :3] = self.normalize(
-            obstacles_repr[:, :3], self.coordinate_frame
-        )
-        obstacles_flat = obstacles_repr.flatten()
         # add number of points as last index
-        obstacles_flat = np.hstack((obstacles_flat, obstacles_repr.shape[0]))
-
-        return obstacles_flat
+        out[-1] = n_points
+        return out
 
-    def compute_obs(self, state):
+    def compute_obs(self, state, out=None):
         q, oMi, oMg = state.q_oM
 
         # dynamic obstacles
         # self.obstacles_pcd = self.compute_pcd()
-        obstacles_pcd = self.represent_obstacles(oMi, self.obstacles_pcd)
+        obstacles_pcd = self.represent_obstacles(oMi, self.obstacles_pcd, out)
         # self.viz.show_obstacles_pin(self.obstacles_pcd)
 
         return {"pcd": obstacles_pcd}
@@ -93,9 +97,8 @@ class PointCloudObserver(BaseObserver):
     def observation(self, obs):
         state = self.env.get_state()
         current_state, goal_state = state["current"], state["goal"]
-        obs_wrapper = self.compute_obs(current_state)
-
-        obs["observation"] = np.concatenate((obs["observation"], obs_wrapper["pcd"]))
+        # the representation is written in the observation buffer
+        self.compute_obs(current_state, self.observation_slice(obs, "obstacles"))
         return obs
 
     def show_representation(self):
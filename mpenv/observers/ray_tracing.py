@@ -8,13 +8,24 @@ from gym import spaces
 from gym.spaces import Dict
 
 from mpenv.observers.base import BaseObserver
+from mpenv.core import boxes2d
+from mpenv.core import se3
 from mpenv.core import utils
+from mpenv.core.local_map import LocalMap
 
 NUM_WITNESS_POINTS = {"sphere": 1, "sphere2d": 1, "s_shape": 6}
 
 
 class RayTracingObserver(BaseObserver):
-    def __init__(self, env, n_samples, n_rays, visibility_radius, memory_distance):
+    def __init__(
+        self,
+        env,
+        n_samples,
+        n_rays,
+        visibility_radius,
+        memory_distance,
+        persistent_map=False,
+    ):
         super().__init__(env)
 
         self.n_samples = n_samples
@@ -25,6 +36,10 @@ class RayTracingObserver(BaseObserver):
         self.memory_distance = memory_distance
         self.n_witnesses = NUM_WITNESS_POINTS[env.robot_name]
         self.n_rays_witness = n_rays // self.n_witnesses
+        # accumulate the hits of the episode in a local map instead of only
+        # representing the hits of the current step
+        self.persistent_map = persistent_map
+        self.local_map = LocalMap(memory_distance) if persistent_map else None
 
         # update observation definition to add the obstacles representation
         self.add_observation("obstacles", self.obstacles_dim)
@@ -33,25 +48,42 @@ class RayTracingObserver(BaseObserver):
     def reset(self, **kwargs):
         o = self.env.reset(**kwargs)
         self.geoms = self.env.geoms
-        # fixed obstacles
-        self.ray_intersector, self.geoms_scene = self.geoms.ray_intersector()
+        # fixed obstacles, planar boxes are intersected analytically without embree
+        self.boxes2d = self.env.boxes2d
+        if self.boxes2d is None:
+            self.ray_intersector, self.geoms_scene = self.geoms.ray_intersector()
         # specific to 2d case
         theta = np.linspace(0, 2 * np.pi, self.n_rays_witness)
         self.rays = np.stack((np.cos(theta), np.sin(theta), np.zeros_like(theta)), 1)
         self.union_pcd = np.zeros((0, 6))
+        if self.local_map is not None:
+            self.local_map.clear()
         o = self.observation(o)
         return o
 
     def represent_obstacles(self, oMi, oMg):
-        ref = oMi[1]
-        ref_inv = ref.inverse()
+        ref_inv = se3.inverse(oMi[1])
         rays_origins = self.witness_points(self.env.robot_name, oMi, oMg)
 
         origins, rays = self.geoms.compute_origins_rays(rays_origins, self.rays)
-        points, normals, _ = self.geoms.ray_intersections(
-            self.ray_intersector, self.geoms_scene, origins, rays
+        points, normals, _ = self.ray_intersections(origins, rays)
+
+        if self.local_map is not None:
+            obstacles_repr = self.represent_local_map(oMi[1], ref_inv, points, normals)
+        else:
+            obstacles_repr = self.represent_hits(ref_inv, points, normals)
+
+        # uncomment for visualization
+        # points, normals = obstacles_repr[:, :3], obstacles_repr[:, 3:]
+        # self.env.o3d_viz.show_pcd(points, normals, blocking=False)
+
+        obstacles_repr[:, :3] = self.normalize(
+            obstacles_repr[:, :3], self.coordinate_frame
         )
 
+        return obstacles_repr
+
+    def represent_hits(self, ref_inv, points, normals):
         # points in reference frame
         points_ref = utils.apply_transformation(ref_inv, points)
         # only keep points close to reference
@@ -60,7 +92,7 @@ class RayTracingObserver(BaseObserver):
         points = points[close]
         points_ref = points_ref[close]
         normals = normals[close]
-        normals_ref = normals.dot(ref_inv.rotation.T)
+        normals_ref = normals.dot(ref_inv[:3, :3].T)
         norm_ref = norm_ref[close]
 
         # local
@@ -74,16 +106,34 @@ class RayTracingObserver(BaseObserver):
         obstacles_repr = sparse_pcd[: self.n_samples]
         obstacles_repr = utils.match_size(sparse_pcd, self.n_samples)[0]
 
-        # uncomment for visualization
-        # points, normals = obstacles_repr[:, :3], obstacles_repr[:, 3:]
-        # self.env.o3d_viz.show_pcd(points, normals, blocking=False)
+        return obstacles_repr
 
-        obstacles_repr[:, :3] = self.normalize(
-            obstacles_repr[:, :3], self.coordinate_frame
-        )
+    def represent_local_map(self, oMref, ref_inv, points, normals):
+        """
+        merge the hits within the visibility radius into the local map
+        and represent its points closest to the reference
+        """
+        center = oMref[:3, 3]
+        visible = np.linalg.norm(points - center, axis=1) < self.visibility_radius
+        self.local_map.insert(points[visible], normals[visible])
+        self.local_map.evict(center, self.visibility_radius)
+        points, normals = self.local_map.nearest(center, self.n_samples)
 
+        points_ref = utils.apply_transformation(ref_inv, points)
+        normals_ref = normals.dot(ref_inv[:3, :3].T)
+        local_pcd = np.hstack((points_ref, normals_ref))
+        if local_pcd.shape[0] == 0:
+            local_pcd = np.zeros((1, 6))
+        obstacles_repr = utils.match_size(local_pcd, self.n_samples)[0]
         return obstacles_repr
 
+    def ray_intersections(self, origins, rays):
+        if self.boxes2d is not None:
+            return boxes2d.ray_intersections(origins, rays, self.boxes2d)
+        return self.geoms.ray_intersections(
+            self.ray_intersector, self.geoms_scene, origins, rays
+        )
+
     def compute_obs(self, state):
         q, oMi, oMg = state.q_oM
 
@@ -96,7 +146,7 @@ class RayTracingObserver(BaseObserver):
         current_state, goal_state = state["current"], state["goal"]
         obs_wrapper = self.compute_obs(current_state)
 
-        obs["observation"] = np.concatenate((obs["observation"], obs_wrapper["pcd"]))
+        self.write_observation(obs, "obstacles", obs_wrapper["pcd"])
 
         return obs
 
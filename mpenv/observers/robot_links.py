@@ -1,10 +1,8 @@
-import numpy as np
-import pinocchio as pin
-
 from gym import spaces
 from gym.spaces import Dict
 
 from mpenv.observers.base import BaseObserver
+from mpenv.core import se3
 from mpenv.core import utils
 
 
@@ -37,14 +35,7 @@ class RobotLinksObserver(BaseObserver):
         if self.coordinate_frame == "local":
             achieved_goal = achieved_goal.reshape(-1, self.n_joints, 4, 4)
             desired_goal = desired_goal.reshape(-1, self.n_joints, 4, 4)
-            diff = np.linalg.inv(achieved_goal) @ desired_goal
-            motions = np.zeros((diff.shape[0], self.n_joints, 6))
-            for i, d in enumerate(diff):
-                for j, dj in enumerate(d):
-                    m = pin.log6(dj)
-                    motions[i, j, :3] = m.linear
-                    motions[i, j, 3:] = m.angular
-            goal_repr = motions
+            goal_repr = se3.difference(achieved_goal, desired_goal)
             goal_repr = goal_repr[:, :, : self.goal_rep_dim]
         elif self.coordinate_frame == "global":
             goal_repr = desired_goal[:, : self.goal_rep_dim]
@@ -95,6 +86,6 @@ class RobotLinksObserver(BaseObserver):
         obs["achieved_q"] = obs_wrapper["achieved_q"]
         obs["desired_q"] = obs_wrapper["desired_q"]
         obs["representation_goal"] = obs_wrapper["goal_repr"]
-        obs["observation"] = np.concatenate((obs["observation"], obs_wrapper["config"]))
+        self.write_observation(obs, "config", obs_wrapper["config"])
 
         return obs
@@ -35,7 +35,7 @@ def solve(env, delta_growth, iterations, simplify):
             dist = distance_fn(q0, q1)
             t1 = min(dist, delta_growth) / (dist + EPSILON)
             q1 = interpolate_fn(q0, q1, t1)
-        path = arange_fn(q0, q1, delta_collision_check)
+        path = env.motion_path(q0, q1)
         q_stop, collide = env.stopping_configuration(path)
         return q_stop, not collide.any()
 
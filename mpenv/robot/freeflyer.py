@@ -55,8 +55,8 @@ class FreeFlyer(Robot):
         return mesh.geom_obj()
 
     def get_ee(self, oMg):
-        return oMg[0]
+        return pin.SE3(oMg[0])
 
     def get_oMg_np(self, oMg):
-        oMg_np = oMg[0].np[None, :]
+        oMg_np = oMg[:1].copy()
         return oMg_np
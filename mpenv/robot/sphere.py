@@ -35,10 +35,10 @@ class Sphere:
         body dimension (width, height, depth)
         goal (gx, gy, gz)
         """
-        return oMg[0].translation
+        return oMg[0, :3, 3].copy()
 
     def get_ee(self, oMg):
-        return oMg[0]
+        return pin.SE3(oMg[0])
 
     def project_q(self, q):
         return np.clip(q, self.bounds[0], self.bounds[1])
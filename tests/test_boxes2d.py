@@ -0,0 +1,27 @@
+import numpy as np
+
+from mpenv.core import boxes2d
+
+
+def test_first_contact_slides_along_collinear_boxes():
+    # a wall made of two collinear boxes meeting at x = 0.5, as maze walls
+    boxes = np.array([[0.0, -0.01, 0.5, 0.01], [0.5, -0.01, 1.0, 0.01]])
+    radius = 0.01
+    # the disk has touched the first box and slides along the wall past the junction
+    p0 = np.array([0.45, 0.02 + 5e-5])
+    p1 = np.array([0.52, 0.02 + 5e-5])
+    t, labels = boxes2d.first_contact(p0, p1, boxes, radius)
+    assert t is None
+    assert not labels.any()
+
+
+def test_first_contact_labels_first_box():
+    boxes = np.array([[0.0, -0.01, 0.5, 0.01], [0.5, -0.01, 1.0, 0.01]])
+    radius = 0.01
+    # moving down onto the junction enters both boxes at the same time
+    p0 = np.array([0.5, 0.1])
+    p1 = np.array([0.5, 0.0])
+    t, labels = boxes2d.first_contact(p0, p1, boxes, radius)
+    assert t is not None
+    assert np.isclose(0.1 - 0.1 * t, 0.02 + 1e-4)
+    assert labels.tolist() == [True, False]
@@ -0,0 +1,60 @@
+import numpy as np
+import pinocchio as pin
+import pytest
+
+from mpenv.core import se3
+
+# batches handled by pinocchio transform by transform and by the vectorized path
+BATCH_SIZES = [1, se3.PIN_BATCH_SIZE, 4 * se3.PIN_BATCH_SIZE]
+
+
+def transforms(n, angles, np_random):
+    axes = np_random.normal(size=(n, 3))
+    axes /= np.linalg.norm(axes, axis=1, keepdims=True)
+    motions = np.hstack((np_random.normal(size=(n, 3)), angles[:, None] * axes))
+    return np.array([pin.exp6(pin.Motion(m)).homogeneous for m in motions])
+
+
+def random_batches(n):
+    np_random = np.random.RandomState(n)
+    return {
+        "random": transforms(n, np_random.uniform(0, np.pi, n), np_random),
+        "small": transforms(n, np_random.uniform(0, 1e-5, n), np_random),
+        "near_pi": transforms(n, np.pi - np_random.uniform(1e-10, 1e-7, n), np_random),
+    }
+
+
+def pin_difference(T0, T1):
+    return np.array(
+        [pin.log6(pin.SE3(M0).actInv(pin.SE3(M1))).vector for M0, M1 in zip(T0, T1)]
+    )
+
+
+@pytest.mark.parametrize("n", BATCH_SIZES)
+@pytest.mark.parametrize("kind", ["random", "small", "near_pi"])
+def test_log6_exp6(n, kind):
+    T = random_batches(n)[kind]
+    motions = np.array([pin.log6(M).vector for M in T])
+    assert np.allclose(se3.log6(T), motions, atol=1e-6)
+    expected = np.array([pin.exp6(pin.Motion(m)).homogeneous for m in motions])
+    assert np.allclose(se3.exp6(motions), expected, atol=1e-8)
+
+
+@pytest.mark.parametrize("n", BATCH_SIZES)
+def test_inverse(n):
+    T = random_batches(n)["random"]
+    expected = np.array([pin.SE3(M).inverse().homogeneous for M in T])
+    assert np.allclose(se3.inverse(T), expected)
+
+
+@pytest.mark.parametrize("n", BATCH_SIZES)
+@pytest.mark.parametrize("kind", ["random", "small", "near_pi"])
+def test_difference_distance(n, kind):
+    T0 = random_batches(n)["random"]
+    # T1 is T0 moved by the batch of the given kind
+    T1 = T0 @ random_batches(n)[kind][::-1]
+    expected = pin_difference(T0, T1)
+    assert np.allclose(se3.difference(T0, T1), expected, atol=1e-6)
+    assert np.allclose(
+        se3.distance(T0, T1), np.linalg.norm(expected, axis=1), atol=1e-6
+    )